@@ -0,0 +1,81 @@
+"""Lightweight argparse entry point for batch analysis: python -m perfetto_agent."""
+
+import argparse
+import os
+import stat
+import sys
+from pathlib import Path
+
+from perfetto_agent.analyzer import ANALYSIS_FEATURES, PerfettoAnalyzer, analyze_trace
+from perfetto_agent.output import write_explanation, write_json
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m perfetto_agent",
+        description="Analyze a Perfetto trace and generate analysis.json (no typer/rich)."
+    )
+    parser.add_argument("--trace", type=Path, required=True, help="Path to Perfetto trace file")
+    parser.add_argument("--out", type=Path, default=Path("analysis.json"), help="Output JSON file path")
+    parser.add_argument("--long-task-ms", type=int, default=50, help="Threshold for long tasks in milliseconds")
+    parser.add_argument("--top-n", type=int, default=5, help="Number of top long tasks to report")
+    parser.add_argument("--focus-process", default=None, help="Filter analysis to a specific process name")
+    parser.add_argument("--schema-version", default="A2", help="Schema version to emit in JSON")
+    parser.add_argument("--explain", action="store_true", help="Generate LLM explanation output")
+    parser.add_argument(
+        "--explain-out", type=Path, default=Path("explanation.md"), help="Explanation Markdown output path"
+    )
+    parser.add_argument(
+        "--feature", action="append", choices=ANALYSIS_FEATURES,
+        help="Only compute this analysis feature (repeatable; default: all)"
+    )
+    parser.add_argument(
+        "--no-assumptions", action="store_true",
+        help="Emit an empty assumptions block (for non-human consumers)"
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+
+    try:
+        mode = os.stat(args.trace).st_mode
+    except (FileNotFoundError, NotADirectoryError):
+        print(f"Error: Trace file not found: {args.trace}", file=sys.stderr)
+        return 1
+    if not stat.S_ISREG(mode):
+        print(f"Error: Path is not a file: {args.trace}", file=sys.stderr)
+        return 1
+
+    try:
+        result = analyze_trace(
+            trace_path=str(args.trace),
+            long_task_ms=args.long_task_ms,
+            top_n=args.top_n,
+            focus_process=args.focus_process,
+            schema_version=args.schema_version,
+            features=args.feature,
+            include_assumptions=not args.no_assumptions
+        )
+        write_json(args.out, result)
+        print(f"✓ Analysis complete: {args.out}")
+
+        if args.explain:
+            from perfetto_agent.explain import run_explain
+
+            llm_input, llm_output, markdown = run_explain(result, None)
+            json_out, input_out = write_explanation(args.explain_out, llm_input, llm_output, markdown)
+            print(f"✓ Explanation written to: {args.explain_out}")
+            print(f"✓ Explanation JSON written to: {json_out}")
+            print(f"✓ LLM input written to: {input_out}")
+    except Exception as e:
+        print(f"Error during analysis: {e}", file=sys.stderr)
+        return 1
+    finally:
+        PerfettoAnalyzer.shutdown_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,551 @@
 """Core analysis logic for Perfetto traces."""
 
+import atexit
+import functools
+import hashlib
+import itertools
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import orjson
 from perfetto.trace_processor import TraceProcessor
 
+from perfetto_agent import __version__
+
+NS_PER_MS = 1_000_000
+
+# Optional analysis sections that analyze_trace(features=...) can select.
+ANALYSIS_FEATURES = (
+    "long_slices_attributed",
+    "app_sections",
+    "frame_features",
+    "cpu_features",
+    "window_breakdown",
+    "work_breakdown"
+)
+
+_SQL_PARAM_RE = re.compile(r":([A-Za-z_]\w*)")
+
+_LONG_TASKS_SQL = """
+SELECT
+    name,
+    dur / 1e6 AS dur_ms,
+    ts / 1e6 AS ts_ms,
+    COUNT(*) OVER () AS total_count
+FROM slice
+WHERE dur >= :threshold_ns
+ORDER BY dur DESC
+LIMIT :limit
+"""
+
+# Provides the thread_slice view used for slice -> thread/process attribution.
+_SLICE_CONTEXT_SQL = "INCLUDE PERFETTO MODULE slices.with_context"
+
+# thread_slice LEFT JOINs thread and process on every read. Materializing the
+# attributed rows once per loaded trace lets every feature query filter a plain
+# table; builds without PERFETTO TABLE fall back to an equivalent view.
+_ATTRIBUTED_SLICE_SELECT = """
+SELECT id, ts, dur, name, utid, tid, thread_name, upid, pid, process_name
+FROM thread_slice
+WHERE upid IS NOT NULL
+"""
+_ATTRIBUTED_SLICE_SQL = (
+    f"CREATE PERFETTO TABLE attributed_slice AS {_ATTRIBUTED_SLICE_SELECT}",
+    f"CREATE VIEW attributed_slice AS {_ATTRIBUTED_SLICE_SELECT}"
+)
+
+# Built once per loaded trace. Only dur gets one: every name predicate here is a
+# leading-wildcard GLOB that an index cannot serve.
+_SLICE_INDEX_SQL = (
+    "CREATE PERFETTO INDEX slice_dur_idx ON slice(dur)",
+    "CREATE PERFETTO INDEX attributed_slice_dur_idx ON attributed_slice(dur)"
+)
+
+
+# Assumption keys the batched metadata query answers for
+_METADATA_ASSUMPTION_KEYS = ("trace_duration", "processes", "earliest_slice", "startup", "frames")
+
+# Trace aggregates (one kind='metrics' row) plus up to 20 distinct processes.
+_METADATA_SQL = """
+    WITH frame_slices AS MATERIALIZED (
+        -- The only pattern scan over slice, reused by the counts and the p95 sort.
+        SELECT ts, dur, name GLOB '*doFrame*' AS is_frame
+        FROM slice
+        WHERE name GLOB '*Choreographer*' OR name GLOB '*doFrame*'
+    ),
+    stats AS (
+        SELECT
+            (SELECT MIN(ts) FROM slice) / 1e6 AS earliest_ms,
+            MIN(ts) / 1e6 AS first_frame_ms,
+            COUNT(CASE WHEN is_frame THEN 1 END) AS frame_total,
+            COUNT(CASE WHEN is_frame THEN dur END) AS frame_dur_count,
+            COUNT(CASE WHEN is_frame AND dur > 16000000 THEN 1 END) AS frame_janky
+        FROM frame_slices
+    ),
+    p95_rank AS (
+        -- Python's round() on (n - 1) * 0.95, i.e. round half to even.
+        SELECT
+            CASE
+                WHEN x - f > 0.5 THEN f + 1
+                WHEN x - f < 0.5 THEN f
+                ELSE f + f % 2
+            END AS offset_rows
+        FROM (
+            SELECT x, CAST(x AS INTEGER) AS f
+            FROM (SELECT (frame_dur_count - 1) * 0.95 AS x FROM stats)
+        )
+    )
+    SELECT
+        'metrics' AS kind,
+        NULL AS pid,
+        NULL AS name,
+        (SELECT (end_ts - start_ts) / 1e6 FROM trace_bounds) AS duration_ms,
+        stats.earliest_ms AS earliest_ms,
+        stats.first_frame_ms AS first_frame_ms,
+        stats.frame_total AS frame_total,
+        stats.frame_dur_count AS frame_dur_count,
+        stats.frame_janky AS frame_janky,
+        (
+            SELECT dur / 1e6
+            FROM frame_slices
+            WHERE is_frame AND dur IS NOT NULL
+            ORDER BY dur
+            LIMIT 1 OFFSET (SELECT offset_rows FROM p95_rank)
+        ) AS frame_p95_ms
+    FROM stats
+    UNION ALL
+    SELECT 'process', pid, name, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM (
+        SELECT DISTINCT pid, name
+        FROM process
+        WHERE pid IS NOT NULL AND name IS NOT NULL
+        ORDER BY pid
+        LIMIT 20
+    )
+"""
+
+# Aggregate columns of the batched metadata query, memoized per analyzer.
+_METRIC_COLUMNS = (
+    "duration_ms",
+    "earliest_ms",
+    "first_frame_ms",
+    "frame_total",
+    "frame_dur_count",
+    "frame_janky",
+    "frame_p95_ms"
+)
+
+# Name tokens behind classify_slice_name, matched against the lowercased name.
+_APP_TOKENS = ("ui#", "bg#", "startupinit")
+_FRAMEWORK_TOKENS = (
+    "choreographer",
+    "doframe",
+    "renderthread",
+    "viewrootimpl",
+    "dequeuebuffer",
+    "blast",
+    "hwui"
+)
+_SYSTEM_TOKENS = ("binder", "surfaceflinger", "sched", "kworker", "irq", "futex")
+
+# One alternation per category so a single C-level search replaces the token loop.
+# Categories keep their priority order, so they are searched separately.
+_APP_TOKEN_SEARCH = re.compile("|".join(map(re.escape, _APP_TOKENS))).search
+_FRAMEWORK_TOKEN_SEARCH = re.compile("|".join(map(re.escape, _FRAMEWORK_TOKENS))).search
+_SYSTEM_TOKEN_SEARCH = re.compile("|".join(map(re.escape, _SYSTEM_TOKENS))).search
+
+
+def _any_token_sql(tokens: tuple[str, ...]) -> str:
+    return " OR ".join(f"instr(lower(s.name), '{token}') > 0" for token in tokens)
+
+
+# classify_slice_name as a SQL expression over attributed_slice s, for :focus_pid.
+_CATEGORY_CASE_SQL = f"""
+CASE
+    WHEN :focus_pid IS NOT NULL AND s.pid IS NOT NULL AND s.pid != :focus_pid THEN 'system'
+    WHEN s.name IS NULL OR s.name = '' THEN 'unknown'
+    WHEN s.pid = :focus_pid AND ({_any_token_sql(_APP_TOKENS)}) THEN 'app'
+    WHEN s.pid = :focus_pid AND ({_any_token_sql(_FRAMEWORK_TOKENS)}) THEN 'framework'
+    WHEN {_any_token_sql(_SYSTEM_TOKENS)} THEN 'system'
+    ELSE 'unknown'
+END"""
+
+
+def _filter_variants(template: str, *clauses: str) -> dict[tuple[bool, bool], str]:
+    """
+    Render a query over attributed_slice s once per optional pid/tid filter combination.
 
-def _q(tp: TraceProcessor, sql: str) -> list[dict]:
+    The template's {where} marker receives the clauses plus s.pid = :pid and/or
+    s.tid = :tid; the result is keyed by (has_pid, has_tid).
+    """
+    variants = {}
+    for has_pid, has_tid in itertools.product((False, True), repeat=2):
+        where = list(clauses)
+        if has_pid:
+            where.append("s.pid = :pid")
+        if has_tid:
+            where.append("s.tid = :tid")
+        variants[has_pid, has_tid] = template.replace("{where}", " AND ".join(where) or "TRUE")
+    return variants
+
+
+# One filtered pass yields the top rows and, via the window, the total count.
+_LONG_SLICES_SQL = _filter_variants(
+    """
+    SELECT
+        s.name AS name,
+        s.dur / 1e6 AS dur_ms,
+        s.ts / 1e6 AS ts_ms,
+        s.pid AS pid,
+        s.tid AS tid,
+        s.thread_name AS thread_name,
+        s.process_name AS process_name,
+        COUNT(*) OVER () AS total_count
+    FROM attributed_slice s
+    WHERE {where}
+    ORDER BY s.dur DESC
+    LIMIT :limit
+    """,
+    "s.dur >= :threshold_ns"
+)
+
+# Focus-scope and main-thread category totals in one grouped pass, keyed by
+# whether a focus pid scopes the first set.
+_CATEGORY_TOTALS_SQL = {
+    has_focus: f"""
+    SELECT
+        {_CATEGORY_CASE_SQL} AS category,
+        COUNT(CASE WHEN {scope} THEN 1 END) AS scope_count,
+        SUM(CASE WHEN {scope} THEN s.dur END) / 1e6 AS scope_ms,
+        COUNT(CASE WHEN s.tid = :main_tid THEN 1 END) AS main_count,
+        SUM(CASE WHEN s.tid = :main_tid THEN s.dur END) / 1e6 AS main_ms
+    FROM attributed_slice s
+    WHERE s.dur >= :threshold_ns AND ({scope} OR s.tid = :main_tid)
+    GROUP BY category
+    """
+    for has_focus, scope in ((False, "TRUE"), (True, "s.pid = :focus_pid"))
+}
+
+# Slices are classified, clipped to each window and summed by the engine. A
+# missing window bound binds as NULL, which never satisfies the overlap test.
+# The trailing row carries only the existence flag.
+_WINDOW_OVERLAPS_SQL = f"""
+WITH windows(window_name, start_ms, end_ms) AS (
+    VALUES
+        ('startup', :startup_start_ms, :startup_end_ms),
+        ('steady_state', :steady_start_ms, :steady_end_ms)
+),
+attributed AS (
+    SELECT
+        {_CATEGORY_CASE_SQL} AS category,
+        COALESCE(s.tid = :main_tid, 0) AS on_main_thread,
+        s.ts / 1e6 - :earliest_ms AS start_ms,
+        s.ts / 1e6 - :earliest_ms + s.dur / 1e6 AS end_ms
+    FROM attributed_slice s
+    WHERE s.dur > 0
+)
+SELECT
+    w.window_name,
+    a.category,
+    a.on_main_thread,
+    SUM(MIN(a.end_ms, w.end_ms) - MAX(a.start_ms, w.start_ms)) AS overlap_ms
+FROM attributed a
+JOIN windows w ON MIN(a.end_ms, w.end_ms) > MAX(a.start_ms, w.start_ms)
+GROUP BY w.window_name, a.category, a.on_main_thread
+UNION ALL
+SELECT NULL, NULL, NULL, EXISTS (SELECT 1 FROM attributed)
+"""
+
+_APP_SECTIONS_SQL = _filter_variants(
+    """
+    SELECT
+        s.name AS name,
+        COUNT(*) AS count,
+        SUM(s.dur) / 1e6 AS total_ms
+    FROM attributed_slice s
+    WHERE {where}
+    GROUP BY s.name
+    ORDER BY total_ms DESC
+    LIMIT 20
+    """,
+    "(s.name GLOB '*#*' OR s.name IN ('StartupInit'))"
+)
+
+# One scan folds the slices into per-thread sums; both rollups then read that
+# small materialized set, and kind tells their rows apart.
+_CPU_FEATURES_SQL = _filter_variants(
+    """
+    WITH per_thread AS MATERIALIZED (
+        SELECT s.pid, s.process_name, s.tid, s.thread_name, SUM(s.dur) AS dur
+        FROM attributed_slice s
+        WHERE {where}
+        GROUP BY s.pid, s.process_name, s.tid, s.thread_name
+    )
+    SELECT * FROM (
+        SELECT
+            'process' AS kind,
+            pid,
+            process_name,
+            NULL AS tid,
+            NULL AS thread_name,
+            SUM(dur) / 1e6 AS total_slice_ms
+        FROM per_thread
+        GROUP BY pid, process_name
+        ORDER BY total_slice_ms DESC
+        LIMIT 10
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT
+            'thread' AS kind,
+            pid,
+            NULL AS process_name,
+            tid,
+            thread_name,
+            SUM(dur) / 1e6 AS total_slice_ms
+        FROM per_thread
+        GROUP BY tid, thread_name, pid
+        ORDER BY total_slice_ms DESC
+        LIMIT 10
+    )
+    """
+)
+
+
+class _SharedTraceProcessor:
+    """
+    A pooled TraceProcessor whose queries may be issued from several threads.
+
+    Analyzers hold a reference while they run. A processor dropped from the
+    cache (stale or evicted) is closed only once its last holder releases it.
+    """
+
+    def __init__(self, trace_path: str):
+        self._tp = TraceProcessor(trace=trace_path)
+        self._lock = threading.Lock()
+        self._closed = False
+        # Both guarded by _TP_LOCK
+        self._refs = 0
+        self._retired = False
+        try:
+            self._tp.query(_SLICE_CONTEXT_SQL)
+        except Exception:
+            # Builds predating stdlib modules ship thread_slice as a built-in view
+            pass
+        for sql in _ATTRIBUTED_SLICE_SQL:
+            try:
+                self._tp.query(sql)
+                break
+            except Exception:
+                continue
+        for sql in _SLICE_INDEX_SQL:
+            try:
+                self._tp.query(sql)
+            except Exception:
+                # Older trace_processor builds lack PERFETTO INDEX; threshold scans still work
+                pass
+
+    def query(self, sql: str):
+        # The binding drives trace_processor over a single HTTP connection, so only the
+        # round-trip is serialized; callers convert the fetched result outside the lock.
+        with self._lock:
+            return self._tp.query(sql)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._tp.close()
+
+    def release(self) -> None:
+        """Drop one analyzer's reference, closing the processor if it was retired."""
+        with _TP_LOCK:
+            self._refs -= 1
+            close_now = self._retired and self._refs == 0
+        if close_now:
+            self.close()
+
+    def _retire(self) -> bool:
+        """Mark as dropped from the cache; True if nobody holds it. Call under _TP_LOCK."""
+        self._retired = True
+        return self._refs == 0
+
+
+# Loaded trace processors shared across analyzers, keyed by (abs path, mtime_ns, size).
+_TP_CACHE_SIZE = 4
+_TP_CACHE: OrderedDict[tuple[str, int, int], _SharedTraceProcessor] = OrderedDict()
+# Loads in flight, so concurrent callers for one key share a single load
+_TP_LOADING: dict[tuple[str, int, int], Future] = {}
+_TP_LOCK = threading.Lock()
+
+
+def _get_tp(trace_path: str, acquire: bool = True) -> _SharedTraceProcessor:
+    """
+    Return a loaded TraceProcessor for trace_path, reusing a cached one if the file is unchanged.
+
+    The trace is loaded outside _TP_LOCK; only callers for the same file version
+    wait on it. With acquire, the caller holds a reference and must release() it.
+    """
+    path = os.path.abspath(trace_path)
+    stat = os.stat(path)
+    # Size catches rewrites that land within the filesystem's mtime granularity
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    while True:
+        with _TP_LOCK:
+            tp = _TP_CACHE.get(key)
+            if tp is not None:
+                _TP_CACHE.move_to_end(key)
+                if acquire:
+                    tp._refs += 1
+                return tp
+            pending = _TP_LOADING.get(key)
+            if pending is None:
+                pending = _TP_LOADING[key] = Future()
+                break
+        # Another caller is loading this version; re-check the cache once it lands
+        pending.result()
+
+    try:
+        tp = _SharedTraceProcessor(trace_path)
+    except BaseException as exc:
+        with _TP_LOCK:
+            del _TP_LOADING[key]
+        pending.set_exception(exc)
+        raise
+
+    unused = []
+    with _TP_LOCK:
+        del _TP_LOADING[key]
+        # Drop processors holding an older version of the same file
+        for stale_key in [cached for cached in _TP_CACHE if cached[0] == path]:
+            stale = _TP_CACHE.pop(stale_key)
+            if stale._retire():
+                unused.append(stale)
+        _TP_CACHE[key] = tp
+        if acquire:
+            tp._refs += 1
+        while len(_TP_CACHE) > _TP_CACHE_SIZE:
+            _, evicted = _TP_CACHE.popitem(last=False)
+            if evicted._retire():
+                unused.append(evicted)
+    pending.set_result(tp)
+    for stale in unused:
+        stale.close()
+    return tp
+
+
+def _sql_literal(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    escaped = str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def _bind(sql: str, params: dict | None) -> str:
+    """
+    Substitute :name placeholders in a query template with SQL literals.
+
+    The perfetto binding has no bound-parameter API, so values are rendered as
+    escaped literals; the template text itself stays constant per query.
+    Templates must not contain ':' inside their own string literals.
+    """
+    if not params:
+        return sql
+    parts = list(_sql_template(sql))
+    for i in range(1, len(parts), 2):
+        parts[i] = _sql_literal(params[parts[i]])
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def _sql_template(sql: str) -> tuple[str, ...]:
+    """Split a template once into alternating text and placeholder names."""
+    return tuple(_SQL_PARAM_RE.split(sql))
+
+
+def _cell_rows(result) -> tuple[tuple, list[tuple]]:
+    """Return (column_names, rows) with rows sliced straight out of the flat cell buffer."""
+    cols = tuple(result.column_names)
+    width = len(cols)
+    if width == 0:
+        return cols, []
+    cells = getattr(result, "cells", None)
+    if cells is None:
+        # Bindings without a public cell buffer still offer the row iterator
+        return cols, [tuple(getattr(row, col) for col in cols) for row in result]
+    # zip over one shared iterator groups the cells width-at-a-time without a Python loop
+    return cols, list(zip(*[iter(cells)] * width))
+
+
+def _q(tp: _SharedTraceProcessor, sql: str, params: dict | None = None) -> list[dict]:
     """Execute a SQL query and return results as a list of dictionaries."""
-    result = tp.query(sql)
-    rows = []
-    for row in result:
-        row_dict = {col: getattr(row, col) for col in result.column_names}
-        rows.append(row_dict)
-    return rows
+    cols, rows = _cell_rows(tp.query(_bind(sql, params)))
+    # map/zip keep the per-row dict construction in C.
+    return list(map(dict, map(zip, itertools.repeat(cols), rows)))
 
 
-def _safe_q(tp: TraceProcessor, sql: str, assumption_key: str, assumptions: dict | None) -> list[dict]:
-    """Execute a SQL query, returning [] on failure and recording the reason."""
+def _q_rows(tp: _SharedTraceProcessor, sql: str, params: dict | None = None) -> list[tuple]:
+    """
+    Execute a SQL query and return rows as tuples in SELECT column order.
+
+    Cheaper than _q when callers unpack positionally and never need column names.
+    """
+    return _cell_rows(tp.query(_bind(sql, params)))[1]
+
+
+def _safe_q(
+    tp: _SharedTraceProcessor,
+    sql: str,
+    assumption_key: str,
+    assumptions: dict | None,
+    fetch=_q,
+    params: dict | None = None
+) -> list:
+    """Execute a SQL query via fetch (_q or _q_rows), returning [] on failure and recording the reason."""
     try:
-        return _q(tp, sql)
+        return fetch(tp, sql, params)
     except Exception as exc:
-        if assumptions is not None and assumption_key not in assumptions:
-            assumptions[assumption_key] = f"Query failed for {assumption_key}: {str(exc)}"
+        if assumptions is not None:
+            _set_assumption(assumptions, assumption_key, f"Query failed for {assumption_key}: {str(exc)}")
         return []
 
 
 def _set_assumption(assumptions: dict, key: str, note: str) -> None:
-    if key not in assumptions:
-        assumptions[key] = note
+    # First note wins; setdefault is a single atomic lookup, so no lock is needed
+    assumptions.setdefault(key, note)
+
+
+def _merge_assumptions(assumptions: dict, notes: dict) -> None:
+    """Fold notes into assumptions in order, keeping any note already recorded."""
+    setdefault = assumptions.setdefault
+    for key, note in notes.items():
+        setdefault(key, note)
 
 
 def _normalize_slice_name(name: str | None) -> str:
     if not name:
         return "<internal slice>"
-    stripped = name.strip()
-    if stripped.isdigit():
-        return "<internal slice>"
-    return name
+    return _normalize_nonempty_name(name)
 
 
-def _percentile(values: list[float], percentile: float) -> float | None:
-    if not values:
-        return None
-    sorted_values = sorted(values)
-    index = int(round((len(sorted_values) - 1) * percentile))
-    return sorted_values[index]
+@functools.lru_cache(maxsize=4096)
+def _normalize_nonempty_name(name: str) -> str:
+    if name[0].isspace() or name[-1].isspace():
+        # Rare: only pay for the strip() copy when there is whitespace to remove
+        stripped = name.strip()
+        return "<internal slice>" if stripped.isdigit() else name
+    if name[0].isdigit() and name.isdigit():
+        return "<internal slice>"
+    return name
 
 
 def classify_slice_name(name: str | None, pid: int | None, focus_pid: int | None) -> str:
@@ -55,26 +558,21 @@ def classify_slice_name(name: str | None, pid: int | None, focus_pid: int | None
     if not name:
         return "unknown"
 
+    return _classify_name(name, focus_pid is not None and pid == focus_pid)
+
+
+@functools.lru_cache(maxsize=8192)
+def _classify_name(name: str, same_pid: bool) -> str:
+    # Slice names repeat heavily across a trace, so the token scans run once per distinct name
     lower_name = name.lower()
-    app_tokens = ["ui#", "bg#", "startupinit"]
-    framework_tokens = [
-        "choreographer",
-        "doframe",
-        "renderthread",
-        "viewrootimpl",
-        "dequeuebuffer",
-        "blast",
-        "hwui"
-    ]
-    system_tokens = ["binder", "surfaceflinger", "sched", "kworker", "irq", "futex"]
-
-    if focus_pid is not None and pid == focus_pid:
-        if any(token in lower_name for token in app_tokens):
+
+    if same_pid:
+        if _APP_TOKEN_SEARCH(lower_name):
             return "app"
-        if any(token in lower_name for token in framework_tokens):
+        if _FRAMEWORK_TOKEN_SEARCH(lower_name):
             return "framework"
 
-    if any(token in lower_name for token in system_tokens):
+    if _SYSTEM_TOKEN_SEARCH(lower_name):
         return "system"
 
     return "unknown"
@@ -83,13 +581,18 @@ def classify_slice_name(name: str | None, pid: int | None, focus_pid: int | None
 def _dominant_category(category_totals: dict[str, float]) -> tuple[str | None, str | None]:
     if not category_totals:
         return None, "No category totals available"
-    max_value = max(category_totals.values())
-    if max_value <= 0:
+    # Single pass: track the leader and whether anything has matched it
+    best_key, best_value, tied = None, None, False
+    for key, value in category_totals.items():
+        if best_value is None or value > best_value:
+            best_key, best_value, tied = key, value, False
+        elif value == best_value:
+            tied = True
+    if best_value <= 0:
         return None, "Category totals are all zero"
-    winners = [key for key, value in category_totals.items() if value == max_value]
-    if len(winners) != 1:
+    if tied:
         return None, "Category totals have a tie"
-    return winners[0], None
+    return best_key, None
 
 
 def _dominant_category_value(category_totals: dict[str, float]) -> tuple[str | None, float | None, str | None]:
@@ -106,12 +609,6 @@ def _prefer_non_unknown_suspects(suspects: list[dict]) -> tuple[list[dict], bool
     return suspects, False
 
 
-def _overlap_ms(start_ms: float, end_ms: float, window_start_ms: float, window_end_ms: float) -> float:
-    latest_start = max(start_ms, window_start_ms)
-    earliest_end = min(end_ms, window_end_ms)
-    return max(0.0, earliest_end - latest_start)
-
-
 class PerfettoAnalyzer:
     """Wrapper for Perfetto TraceProcessor with helper utilities."""
 
@@ -123,11 +620,94 @@ class PerfettoAnalyzer:
             trace_path: Path to the Perfetto trace file
         """
         self.trace_path = trace_path
-        self.tp = TraceProcessor(trace=trace_path)
+        self.tp = _get_tp(trace_path)
+        self._released = False
+        self._trace_metrics_row: dict | None = None
+        self._processes: list[dict] | None = None
+        self._long_tasks: dict[tuple[int, int], tuple[int, list[dict]]] = {}
+        # Keyed by (threshold_ms, top_n, pid_filter, tid_filter); the lock lets concurrent
+        # callers asking for the same rollup wait for one query instead of racing.
+        self._long_slices: dict[tuple, tuple[int, list[tuple]]] = {}
+        self._long_slices_lock = threading.Lock()
 
     def close(self):
-        """Close the trace processor."""
-        self.tp.close()
+        """
+        Release the analyzer's reference to its trace processor.
+
+        The processor stays loaded in the shared cache for later analyzers of the
+        same trace; one already dropped from the cache is closed here if this was
+        its last holder. Use shutdown_all() to stop every processor.
+        """
+        if not self._released:
+            self._released = True
+            self.tp.release()
+
+    @staticmethod
+    def prewarm(trace_path: str) -> threading.Thread:
+        """
+        Start loading trace_path into the shared cache on a background thread.
+
+        An analyzer created for the same trace afterwards waits for that load
+        instead of starting its own. The load runs outside the cache lock, so
+        analyzers of other traces, cached or not, never wait for it. The
+        prewarmed processor is not held, so it may be evicted like any other.
+        Load errors are not raised here; they surface again when the trace is
+        analyzed.
+        """
+        def load() -> None:
+            try:
+                _get_tp(trace_path, acquire=False)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=load, name="perfetto-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def shutdown_all() -> None:
+        """Close every cached trace processor."""
+        with _TP_LOCK:
+            processors = list(_TP_CACHE.values())
+            _TP_CACHE.clear()
+            for tp in processors:
+                tp._retire()
+        for tp in processors:
+            tp.close()
+
+    def _load_metadata(self, assumptions: dict) -> None:
+        """
+        Fetch the trace aggregates and the process list in one round-trip.
+
+        The single aggregate row comes first (kind='metrics'), followed by up to
+        20 process rows (kind='process').
+        """
+        try:
+            rows = _q(self.tp, _METADATA_SQL)
+        except Exception as exc:
+            rows = []
+            # Note the failure under each key the separate queries used to report
+            for key in _METADATA_ASSUMPTION_KEYS:
+                _set_assumption(assumptions, key, f"Query failed for {key}: {str(exc)}")
+
+        metrics: dict = {}
+        processes: list[dict] = []
+        for row in rows:
+            if row["kind"] == "metrics":
+                metrics = {key: row[key] for key in _METRIC_COLUMNS}
+            else:
+                processes.append({"pid": row["pid"], "name": row["name"]})
+
+        self._trace_metrics_row = metrics
+        self._processes = processes
+
+    def _trace_metrics(self, assumptions: dict) -> dict:
+        """
+        Return duration, startup and frame count aggregates.
+        """
+        if self._trace_metrics_row is None:
+            self._load_metadata(assumptions)
+        return self._trace_metrics_row
 
     def get_trace_duration_ms(self, assumptions: dict) -> float | None:
         """
@@ -136,15 +716,7 @@ class PerfettoAnalyzer:
         Returns:
             Duration in milliseconds or None if not available
         """
-        rows = _safe_q(
-            self.tp,
-            "SELECT (end_ts - start_ts) / 1e6 AS duration_ms FROM trace_bounds",
-            "trace_duration",
-            assumptions
-        )
-        if rows and len(rows) > 0:
-            return rows[0].get("duration_ms")
-        return None
+        return self._trace_metrics(assumptions).get("duration_ms")
 
     def get_processes(self, assumptions: dict) -> list[dict]:
         """
@@ -153,30 +725,12 @@ class PerfettoAnalyzer:
         Returns:
             List of process dictionaries with pid and name
         """
-        rows = _safe_q(
-            self.tp,
-            """
-            SELECT DISTINCT pid, name
-            FROM process
-            WHERE pid IS NOT NULL AND name IS NOT NULL
-            ORDER BY pid
-            LIMIT 20
-            """,
-            "processes",
-            assumptions
-        )
-        return [{"pid": row["pid"], "name": row["name"]} for row in rows]
+        if self._processes is None:
+            self._load_metadata(assumptions)
+        return self._processes
 
     def get_earliest_slice_ms(self, assumptions: dict) -> float | None:
-        rows = _safe_q(
-            self.tp,
-            "SELECT MIN(ts) / 1e6 AS earliest_ms FROM slice",
-            "earliest_slice",
-            assumptions
-        )
-        if rows:
-            return rows[0].get("earliest_ms")
-        return None
+        return self._trace_metrics(assumptions).get("earliest_ms")
 
     def resolve_focus_pid(self, focus_process: str | None, assumptions: dict) -> int | None:
         """
@@ -185,48 +739,38 @@ class PerfettoAnalyzer:
         if not focus_process:
             return None
 
-        escaped = focus_process.replace("'", "''")
-        candidates = _safe_q(
-            self.tp,
-            f"""
-            SELECT pid, name
-            FROM process
-            WHERE name = '{escaped}'
-            """,
-            "focus_process",
-            assumptions
-        )
-
-        if not candidates:
-            return None
-
-        if len(candidates) == 1:
-            return candidates[0].get("pid")
-
-        ranked = _safe_q(
+        # Candidates and their ranking travel in one query; the ranking scan is
+        # skipped outright when the name is unambiguous.
+        rows = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                p.pid AS pid,
-                COUNT(s.id) AS slice_count,
-                MAX(s.ts) AS max_ts
-            FROM process p
-            JOIN thread t ON t.upid = p.upid
-            JOIN thread_track tt ON tt.utid = t.utid
-            JOIN slice s ON s.track_id = tt.id
-            WHERE p.name = '{escaped}'
-            GROUP BY p.pid
-            ORDER BY slice_count DESC, max_ts DESC
+            """
+            WITH candidates AS (
+                SELECT upid, pid
+                FROM process
+                WHERE name = :name
+            ),
+            ranked AS (
+                SELECT
+                    s.pid AS pid,
+                    COUNT(s.id) AS slice_count,
+                    MAX(s.ts) AS max_ts
+                FROM attributed_slice s
+                WHERE s.process_name = :name
+                  AND (SELECT COUNT(*) FROM candidates) > 1
+                GROUP BY s.pid
+            )
+            SELECT c.pid AS pid
+            FROM candidates c
+            LEFT JOIN ranked r ON r.pid = c.pid
+            ORDER BY r.slice_count IS NULL, r.slice_count DESC, r.max_ts DESC, c.upid
             LIMIT 1
             """,
             "focus_process",
-            assumptions
+            assumptions,
+            fetch=_q_rows,
+            params={"name": focus_process}
         )
-
-        if ranked:
-            return ranked[0].get("pid")
-
-        return candidates[0].get("pid")
+        return rows[0][0] if rows else None
 
     def resolve_main_thread(self, focus_pid: int | None, assumptions: dict) -> dict | None:
         """
@@ -235,34 +779,10 @@ class PerfettoAnalyzer:
         if focus_pid is None:
             return None
 
-        main_by_name = _safe_q(
-            self.tp,
-            f"""
-            SELECT
-                t.tid AS tid,
-                t.name AS name,
-                p.pid AS pid,
-                p.name AS process_name
-            FROM thread t
-            JOIN process p ON t.upid = p.upid
-            WHERE p.pid = {focus_pid} AND t.name = 'main'
-            LIMIT 1
-            """,
-            "main_thread",
-            assumptions
-        )
-
-        if main_by_name:
-            return {
-                "tid": main_by_name[0].get("tid"),
-                "name": main_by_name[0].get("name"),
-                "pid": main_by_name[0].get("pid"),
-                "process_name": main_by_name[0].get("process_name")
-            }
-
-        main_by_tid = _safe_q(
+        # A thread named 'main' wins; otherwise fall back to the thread whose tid == pid
+        rows = _safe_q(
             self.tp,
-            f"""
+            """
             SELECT
                 t.tid AS tid,
                 t.name AS name,
@@ -270,22 +790,15 @@ class PerfettoAnalyzer:
                 p.name AS process_name
             FROM thread t
             JOIN process p ON t.upid = p.upid
-            WHERE p.pid = {focus_pid} AND t.tid = p.pid
+            WHERE p.pid = :pid AND (t.name = 'main' OR t.tid = p.pid)
+            ORDER BY CASE WHEN t.name = 'main' THEN 0 ELSE 1 END, t.utid
             LIMIT 1
             """,
             "main_thread",
-            assumptions
+            assumptions,
+            params={"pid": focus_pid}
         )
-
-        if main_by_tid:
-            return {
-                "tid": main_by_tid[0].get("tid"),
-                "name": main_by_tid[0].get("name"),
-                "pid": main_by_tid[0].get("pid"),
-                "process_name": main_by_tid[0].get("process_name")
-            }
-
-        return None
+        return rows[0] if rows else None
 
     def _query_long_slices_attributed(
         self,
@@ -295,136 +808,140 @@ class PerfettoAnalyzer:
         tid_filter: int | None,
         assumptions: dict,
         assumption_key: str
-    ) -> tuple[int, list[dict]]:
-        where_clauses = [f"s.dur / 1e6 >= {threshold_ms}"]
-        if pid_filter is not None:
-            where_clauses.append(f"p.pid = {pid_filter}")
-        if tid_filter is not None:
-            where_clauses.append(f"t.tid = {tid_filter}")
-        where_sql = " AND ".join(where_clauses)
-
-        count_rows = _safe_q(
-            self.tp,
-            f"""
-            SELECT COUNT(*) AS count
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            WHERE {where_sql}
-            """,
-            assumption_key,
-            assumptions
-        )
-        count = count_rows[0]["count"] if count_rows else 0
-
-        top_rows = _safe_q(
-            self.tp,
-            f"""
-            SELECT
-                s.name AS name,
-                s.dur / 1e6 AS dur_ms,
-                s.ts / 1e6 AS ts_ms,
-                p.pid AS pid,
-                t.tid AS tid,
-                t.name AS thread_name,
-                p.name AS process_name
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            WHERE {where_sql}
-            ORDER BY s.dur DESC
-            LIMIT {top_n}
-            """,
-            assumption_key,
-            assumptions
-        )
-
-        top = []
-        for row in top_rows:
-            top.append(
-                {
-                    "name": _normalize_slice_name(row.get("name")),
-                    "dur_ms": row.get("dur_ms"),
-                    "ts_ms": row.get("ts_ms"),
-                    "pid": row.get("pid"),
-                    "tid": row.get("tid"),
-                    "thread_name": row.get("thread_name"),
-                    "process_name": row.get("process_name")
-                }
+    ) -> tuple[int, list[tuple]]:
+        """
+        Return (count, top) where top holds (name, dur_ms, ts_ms, pid, tid, thread_name,
+        process_name) tuples with names already normalized; callers project what they need.
+        """
+        cache_key = (threshold_ms, top_n, pid_filter, tid_filter)
+        with self._long_slices_lock:
+            cached = self._long_slices.get(cache_key)
+            if cached is not None:
+                return cached
+            count, top, complete = self._fetch_long_slices_attributed(
+                threshold_ms, top_n, pid_filter, tid_filter, assumptions, assumption_key
             )
-        return count, top
+            # Failed queries are retried so each caller records its own failure note
+            if complete:
+                self._long_slices[cache_key] = (count, top)
+            return count, top
 
-    def _query_attributed_slices(
+    def _fetch_long_slices_attributed(
         self,
         threshold_ms: int,
+        top_n: int,
         pid_filter: int | None,
         tid_filter: int | None,
         assumptions: dict,
         assumption_key: str
-    ) -> list[dict]:
-        where_clauses = [f"s.dur / 1e6 >= {threshold_ms}"]
-        if pid_filter is not None:
-            where_clauses.append(f"p.pid = {pid_filter}")
-        if tid_filter is not None:
-            where_clauses.append(f"t.tid = {tid_filter}")
-        where_sql = " AND ".join(where_clauses)
-
-        return _safe_q(
+    ) -> tuple[int, list[tuple], bool]:
+        # Failures are captured separately because an empty result is also a valid count of 0.
+        failures: dict = {}
+        top_rows = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                s.name AS name,
-                s.dur / 1e6 AS dur_ms,
-                p.pid AS pid,
-                t.tid AS tid
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            WHERE {where_sql}
-            """,
+            _LONG_SLICES_SQL[pid_filter is not None, tid_filter is not None],
             assumption_key,
-            assumptions
+            failures,
+            fetch=_q_rows,
+            params={
+                "threshold_ns": threshold_ms * NS_PER_MS,
+                "pid": pid_filter,
+                "tid": tid_filter,
+                "limit": top_n or 1
+            }
         )
+        if failures:
+            _merge_assumptions(assumptions, failures)
+            return 0, [], False
 
-    def _query_attributed_slices_with_ts(
+        count = top_rows[0][7] if top_rows else 0
+        if top_n == 0:
+            # The single row was only fetched to read the count
+            top_rows = []
+
+        top = [(_normalize_slice_name(row[0]),) + row[1:7] for row in top_rows]
+        return count, top, True
+
+    def _query_category_totals(
         self,
-        pid_filter: int | None,
-        tid_filter: int | None,
+        threshold_ms: int,
+        focus_pid: int | None,
+        main_tid: int | None,
+        assumptions: dict,
+        assumption_keys: tuple[str, ...]
+    ) -> tuple[dict[str, float] | None, dict[str, float] | None]:
+        """
+        Sum attributed slices over the threshold per classify_slice_name category.
+
+        One query yields both the focus-scope totals (every process without a
+        focus pid) and the main-thread totals. Each is None when no slice
+        qualifies, otherwise totals for all four categories.
+        """
+        params = {
+            "threshold_ns": threshold_ms * NS_PER_MS,
+            "focus_pid": focus_pid,
+            "main_tid": main_tid
+        }
+
+        try:
+            rows = _q_rows(self.tp, _CATEGORY_TOTALS_SQL[focus_pid is not None], params)
+        except Exception as exc:
+            for key in assumption_keys:
+                _set_assumption(assumptions, key, f"Query failed for {key}: {str(exc)}")
+            rows = []
+
+        scope_totals = None
+        main_totals = None
+        for category, scope_count, scope_ms, main_count, main_ms in rows:
+            if scope_count:
+                if scope_totals is None:
+                    scope_totals = {"app": 0.0, "framework": 0.0, "system": 0.0, "unknown": 0.0}
+                scope_totals[category] = float(scope_ms)
+            if main_count:
+                if main_totals is None:
+                    main_totals = {"app": 0.0, "framework": 0.0, "system": 0.0, "unknown": 0.0}
+                main_totals[category] = float(main_ms)
+        return scope_totals, main_totals
+
+    def _query_window_overlaps(
+        self,
+        time_windows: dict,
+        focus_pid: int | None,
+        main_tid: int | None,
+        earliest_ms: float,
         assumptions: dict,
         assumption_key: str
-    ) -> list[dict]:
-        where_clauses = ["s.dur > 0"]
-        if pid_filter is not None:
-            where_clauses.append(f"p.pid = {pid_filter}")
-        if tid_filter is not None:
-            where_clauses.append(f"t.tid = {tid_filter}")
-        where_sql = " AND ".join(where_clauses)
-
-        return _safe_q(
+    ) -> tuple[bool, list[tuple]]:
+        """
+        Sum how long attributed slices overlap each time window, inside the query.
+
+        Returns (any_slices, rows) where rows are (window, category, on_main_thread,
+        overlap_ms) groups and any_slices tells whether any attributed slice exists.
+        """
+        params = {"focus_pid": focus_pid, "main_tid": main_tid, "earliest_ms": float(earliest_ms)}
+        for prefix, window_name in (("startup", "startup"), ("steady", "steady_state")):
+            window = time_windows.get(window_name, {})
+            for bound in ("start_ms", "end_ms"):
+                value = window.get(bound)
+                params[f"{prefix}_{bound}"] = float(value) if value is not None else None
+
+        rows = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                s.name AS name,
-                s.ts / 1e6 AS ts_ms,
-                s.dur / 1e6 AS dur_ms,
-                p.pid AS pid,
-                t.tid AS tid
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            WHERE {where_sql}
-            """,
+            _WINDOW_OVERLAPS_SQL,
             assumption_key,
-            assumptions
+            assumptions,
+            fetch=_q_rows,
+            params=params
         )
+        # UNION ALL promises no branch order, so pick the flag row (NULL window) explicitly
+        any_slices = False
+        overlaps = []
+        for row in rows:
+            if row[0] is None:
+                any_slices = bool(row[3])
+            else:
+                overlaps.append(row)
+        return any_slices, overlaps
 
     def get_long_slices_attributed(
         self,
@@ -443,15 +960,15 @@ class PerfettoAnalyzer:
         )
         top_payload = [
             {
-                "name": item["name"],
-                "dur_ms": item["dur_ms"],
-                "pid": item["pid"],
-                "tid": item["tid"],
-                "thread_name": item["thread_name"],
-                "process_name": item["process_name"],
-                "category": classify_slice_name(item["name"], item["pid"], focus_pid)
+                "name": name,
+                "dur_ms": dur_ms,
+                "pid": pid,
+                "tid": tid,
+                "thread_name": thread_name,
+                "process_name": process_name,
+                "category": classify_slice_name(name, pid, focus_pid)
             }
-            for item in top
+            for name, dur_ms, _, pid, tid, thread_name, process_name in top
         ]
         return {
             "threshold_ms": threshold_ms,
@@ -466,66 +983,38 @@ class PerfettoAnalyzer:
         main_thread: dict | None,
         assumptions: dict
     ) -> dict:
-        rows = self._query_attributed_slices(
+        # A falsy tid counts as no main thread, as before
+        main_tid = (main_thread.get("tid") if main_thread else None) or None
+
+        # Categories are assigned and summed inside one query for both scopes;
+        # at most four grouped rows come back
+        by_category_ms, main_totals = self._query_category_totals(
             threshold_ms,
             focus_pid,
-            None,
+            main_tid,
             assumptions,
-            "work_breakdown"
+            ("work_breakdown", "main_thread_blocking") if main_tid else ("work_breakdown",)
         )
 
-        if not rows:
+        if by_category_ms is None:
             _set_assumption(
                 assumptions,
                 "work_breakdown",
                 "No attributed slices available for work breakdown"
             )
-            by_category_ms: dict[str, float] = {}
-        else:
-            by_category_ms = {
-                "app": 0.0,
-                "framework": 0.0,
-                "system": 0.0,
-                "unknown": 0.0
-            }
-            for row in rows:
-                dur_ms = row.get("dur_ms")
-                if dur_ms is None:
-                    continue
-                category = classify_slice_name(row.get("name"), row.get("pid"), focus_pid)
-                by_category_ms[category] += float(dur_ms)
-
-        if not main_thread or not main_thread.get("tid"):
+            by_category_ms = {}
+
+        main_thread_blocking: dict[str, float] = {}
+        if main_tid is None:
             _set_assumption(
                 assumptions,
                 "main_thread_blocking",
                 "Main thread unavailable for blocking breakdown"
             )
-            main_thread_blocking: dict[str, float] = {}
-        else:
-            main_rows = self._query_attributed_slices(
-                threshold_ms,
-                None,
-                main_thread.get("tid"),
-                assumptions,
-                "main_thread_blocking"
-            )
-            if not main_rows:
-                main_thread_blocking = {}
-            else:
-                main_thread_blocking = {
-                    "app_ms": 0.0,
-                    "framework_ms": 0.0,
-                    "system_ms": 0.0,
-                    "unknown_ms": 0.0
-                }
-                for row in main_rows:
-                    dur_ms = row.get("dur_ms")
-                    if dur_ms is None:
-                        continue
-                    category = classify_slice_name(row.get("name"), row.get("pid"), focus_pid)
-                    key = f"{category}_ms"
-                    main_thread_blocking[key] += float(dur_ms)
+        elif main_totals is not None:
+            main_thread_blocking = {
+                f"{category}_ms": total_ms for category, total_ms in main_totals.items()
+            }
 
         return {
             "by_category_ms": by_category_ms,
@@ -551,13 +1040,18 @@ class PerfettoAnalyzer:
                 "steady_state": {"by_category_ms": {}, "main_thread_blocking_ms": {}}
             }
 
-        rows = self._query_attributed_slices_with_ts(
-            None,
-            None,
+        # Slices are classified, clipped to each window and summed by the engine,
+        # so only a handful of grouped rows come back instead of every slice.
+        main_tid = main_thread.get("tid") if main_thread else None
+        any_slices, rows = self._query_window_overlaps(
+            time_windows,
+            focus_pid,
+            main_tid,
+            earliest_ms,
             assumptions,
             "window_breakdown"
         )
-        if not rows:
+        if not any_slices:
             _set_assumption(
                 assumptions,
                 "window_breakdown",
@@ -574,38 +1068,16 @@ class PerfettoAnalyzer:
         def init_blocking_totals() -> dict:
             return {"app_ms": 0.0, "framework_ms": 0.0, "system_ms": 0.0, "unknown_ms": 0.0}
 
-        startup_window = time_windows.get("startup", {})
-        steady_window = time_windows.get("steady_state", {})
-        windows = {
-            "startup": startup_window,
-            "steady_state": steady_window
-        }
         breakdown = {
             "startup": {"by_category_ms": init_category_totals(), "main_thread_blocking_ms": init_blocking_totals()},
             "steady_state": {"by_category_ms": init_category_totals(), "main_thread_blocking_ms": init_blocking_totals()}
         }
 
-        for row in rows:
-            ts_ms = row.get("ts_ms")
-            dur_ms = row.get("dur_ms")
-            if ts_ms is None or dur_ms is None:
-                continue
-            start_ms = float(ts_ms) - earliest_ms
-            end_ms = start_ms + float(dur_ms)
-            category = classify_slice_name(row.get("name"), row.get("pid"), focus_pid)
-
-            for window_name, window in windows.items():
-                window_start = window.get("start_ms")
-                window_end = window.get("end_ms")
-                if window_start is None or window_end is None:
-                    continue
-                overlap = _overlap_ms(start_ms, end_ms, float(window_start), float(window_end))
-                if overlap <= 0:
-                    continue
-                breakdown[window_name]["by_category_ms"][category] += overlap
-                if main_thread and row.get("tid") == main_thread.get("tid"):
-                    key = f"{category}_ms"
-                    breakdown[window_name]["main_thread_blocking_ms"][key] += overlap
+        for window_name, category, on_main_thread, overlap_ms in rows:
+            window_totals = breakdown[window_name]
+            window_totals["by_category_ms"][category] += overlap_ms
+            if on_main_thread:
+                window_totals["main_thread_blocking_ms"][f"{category}_ms"] += overlap_ms
 
         if not main_thread:
             _set_assumption(
@@ -658,12 +1130,8 @@ class PerfettoAnalyzer:
             assumption = "Long tasks computed across all slices (no focus process or main thread)"
 
         top_list = [
-            {
-                "name": item["name"],
-                "dur_ms": item["dur_ms"],
-                "ts_ms": item["ts_ms"]
-            }
-            for item in top
+            {"name": name, "dur_ms": dur_ms, "ts_ms": ts_ms}
+            for name, dur_ms, ts_ms, *_ in top
         ]
         return count, top_list, assumption
 
@@ -671,66 +1139,33 @@ class PerfettoAnalyzer:
         """
         Extract app-defined sections from slices using simple heuristics.
         """
-        where_clauses = ["(s.name LIKE '%#%' OR s.name IN ('StartupInit'))"]
-        if focus_pid is not None:
-            where_clauses.append(f"p.pid = {focus_pid}")
-        where_sql = " AND ".join(where_clauses)
-
         rows = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                s.name AS name,
-                COUNT(*) AS count,
-                SUM(s.dur) / 1e6 AS total_ms
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            WHERE {where_sql}
-            GROUP BY s.name
-            ORDER BY total_ms DESC
-            LIMIT 20
-            """,
+            _APP_SECTIONS_SQL[focus_pid is not None, False],
             "app_sections",
-            assumptions
+            assumptions,
+            fetch=_q_rows,
+            params={"pid": focus_pid}
         )
 
-        counts: dict[str, int] = {}
-        top_by_total_ms = []
-        for row in rows:
-            name = _normalize_slice_name(row.get("name"))
-            counts[name] = row.get("count") or 0
-            top_by_total_ms.append(
-                {
-                    "name": name,
-                    "total_ms": row.get("total_ms"),
-                    "count": row.get("count")
-                }
-            )
-
+        # Names matched by the filter contain '#' or equal 'StartupInit', so they are never
+        # empty or all digits and _normalize_slice_name would return them unchanged.
         return {
-            "counts": counts,
-            "top_by_total_ms": top_by_total_ms
+            "counts": {name: count or 0 for name, count, _ in rows},
+            "top_by_total_ms": [
+                {"name": name, "total_ms": total_ms, "count": count}
+                for name, count, total_ms in rows
+            ]
         }
 
     def get_frame_features(self, assumptions: dict) -> dict:
         """
         Compute frame feature aggregates including p95 duration.
-        """
-        rows = _safe_q(
-            self.tp,
-            """
-            SELECT dur / 1e6 AS dur_ms
-            FROM slice
-            WHERE name LIKE '%doFrame%'
-            """,
-            "frames",
-            assumptions
-        )
 
-        if not rows:
+        Reads the counts and p95 folded into the batched metadata query.
+        """
+        metrics = self._trace_metrics(assumptions)
+        if not metrics.get("frame_total"):
             _set_assumption(assumptions, "frames", "No doFrame slices found for frame features")
             return {
                 "total_frames": None,
@@ -738,8 +1173,7 @@ class PerfettoAnalyzer:
                 "p95_frame_ms": None
             }
 
-        durations = [row["dur_ms"] for row in rows if row.get("dur_ms") is not None]
-        if not durations:
+        if not metrics.get("frame_dur_count"):
             _set_assumption(assumptions, "frames", "Frame durations unavailable for p95 calculation")
             return {
                 "total_frames": None,
@@ -747,93 +1181,42 @@ class PerfettoAnalyzer:
                 "p95_frame_ms": None
             }
 
-        total_frames = len(durations)
-        janky_frames = len([value for value in durations if value > 16])
-        p95_frame_ms = _percentile(durations, 0.95)
-
         return {
-            "total_frames": total_frames,
-            "janky_frames": janky_frames,
-            "p95_frame_ms": p95_frame_ms
+            "total_frames": metrics["frame_dur_count"],
+            "janky_frames": metrics["frame_janky"],
+            "p95_frame_ms": metrics["frame_p95_ms"]
         }
 
     def get_cpu_features(self, focus_pid: int | None, assumptions: dict) -> dict:
         """
         Compute CPU-ish aggregates using slice duration totals.
         """
-        process_filter = ""
-        if focus_pid is not None:
-            process_filter = f"WHERE p.pid = {focus_pid}"
-
-        process_rows = _safe_q(
-            self.tp,
-            f"""
-            SELECT
-                p.pid AS pid,
-                p.name AS process_name,
-                SUM(s.dur) / 1e6 AS total_slice_ms
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            {process_filter}
-            GROUP BY p.pid, p.name
-            ORDER BY total_slice_ms DESC
-            LIMIT 10
-            """,
-            "cpu_features",
-            assumptions
-        )
-
-        thread_filter = ""
-        if focus_pid is not None:
-            thread_filter = f"WHERE p.pid = {focus_pid}"
-
-        thread_rows = _safe_q(
+        rows = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                t.tid AS tid,
-                t.name AS thread_name,
-                p.pid AS pid,
-                SUM(s.dur) / 1e6 AS total_slice_ms
-            FROM slice s
-            JOIN track tr ON s.track_id = tr.id
-            JOIN thread_track tt ON tt.id = tr.id
-            JOIN thread t ON t.utid = tt.utid
-            JOIN process p ON p.upid = t.upid
-            {thread_filter}
-            GROUP BY t.tid, t.name, p.pid
-            ORDER BY total_slice_ms DESC
-            LIMIT 10
-            """,
+            _CPU_FEATURES_SQL[focus_pid is not None, False],
             "cpu_features",
-            assumptions
+            assumptions,
+            fetch=_q_rows,
+            params={"pid": focus_pid}
         )
 
-        top_processes = [
-            {
-                "pid": row.get("pid"),
-                "process_name": row.get("process_name"),
-                "total_slice_ms": row.get("total_slice_ms")
-            }
-            for row in process_rows
-        ]
-        top_threads = [
-            {
-                "tid": row.get("tid"),
-                "thread_name": row.get("thread_name"),
-                "pid": row.get("pid"),
-                "total_slice_ms": row.get("total_slice_ms")
-            }
-            for row in thread_rows
-        ]
+        top_processes = []
+        top_threads = []
+        for kind, pid, process_name, tid, thread_name, total_slice_ms in rows:
+            if kind == "process":
+                top_processes.append(
+                    {"pid": pid, "process_name": process_name, "total_slice_ms": total_slice_ms}
+                )
+            else:
+                top_threads.append(
+                    {"tid": tid, "thread_name": thread_name, "pid": pid, "total_slice_ms": total_slice_ms}
+                )
 
         return {
             "top_processes_by_slice_ms": top_processes,
             "top_threads_by_slice_ms": top_threads
         }
+
     def get_startup_ms(self, assumptions: dict) -> tuple[float | None, str]:
         """
         Estimate app startup time using a simple heuristic.
@@ -843,34 +1226,15 @@ class PerfettoAnalyzer:
         Returns:
             Tuple of (startup_ms, assumption_note)
         """
-        # Get earliest slice timestamp
-        earliest = _safe_q(
-            self.tp,
-            "SELECT MIN(ts) / 1e6 AS earliest_ms FROM slice",
-            "startup",
-            assumptions
-        )
-        if not earliest or earliest[0].get("earliest_ms") is None:
+        metrics = self._trace_metrics(assumptions)
+        earliest_ms = metrics.get("earliest_ms")
+        if earliest_ms is None:
             return None, "No slices found in trace"
 
-        earliest_ms = earliest[0]["earliest_ms"]
-
-        # Find first Choreographer/doFrame slice
-        first_frame = _safe_q(
-            self.tp,
-            """
-            SELECT MIN(ts) / 1e6 AS first_frame_ms
-            FROM slice
-            WHERE name LIKE '%Choreographer%' OR name LIKE '%doFrame%'
-            """,
-            "startup",
-            assumptions
-        )
-
-        if not first_frame or first_frame[0].get("first_frame_ms") is None:
+        first_frame_ms = metrics.get("first_frame_ms")
+        if first_frame_ms is None:
             return None, "No Choreographer/doFrame slices found for startup detection"
 
-        first_frame_ms = first_frame[0]["first_frame_ms"]
         startup_duration = first_frame_ms - earliest_ms
 
         assumption = (
@@ -890,50 +1254,36 @@ class PerfettoAnalyzer:
         Returns:
             Tuple of (total_count, top_tasks_list, assumption_note)
         """
-        # Count all slices that exceed the threshold
-        count_result = _safe_q(
-            self.tp,
-            f"""
-            SELECT COUNT(*) AS count
-            FROM slice
-            WHERE dur / 1e6 >= {threshold_ms}
-            """,
-            "long_tasks",
-            assumptions
+        assumption = (
+            f"Long tasks detected as slices with dur >= {threshold_ms}ms. "
+            "Note: UI thread attribution not yet implemented (planned for Week A2)"
         )
+        cache_key = (threshold_ms, top_n)
+        if cache_key in self._long_tasks:
+            total_count, top_list = self._long_tasks[cache_key]
+            return total_count, top_list, assumption
 
-        total_count = count_result[0]["count"] if count_result else 0
-
-        # Get top N longest tasks
+        # One filtered scan yields both the top N rows and, via the window, the total count.
+        # Filter on raw ns so the predicate is a plain int compare.
         top_tasks = _safe_q(
             self.tp,
-            f"""
-            SELECT
-                name,
-                dur / 1e6 AS dur_ms,
-                ts / 1e6 AS ts_ms
-            FROM slice
-            WHERE dur / 1e6 >= {threshold_ms}
-            ORDER BY dur DESC
-            LIMIT {top_n}
-            """,
+            _LONG_TASKS_SQL,
             "long_tasks",
-            assumptions
+            assumptions,
+            fetch=_q_rows,
+            params={"threshold_ns": int(threshold_ms) * NS_PER_MS, "limit": int(top_n) or 1}
         )
 
+        total_count = top_tasks[0][3] if top_tasks else 0
+        if top_n == 0:
+            # The single row was only fetched to read the count
+            top_tasks = []
+
         top_list = [
-            {
-                "name": task["name"],
-                "dur_ms": task["dur_ms"],
-                "ts_ms": task["ts_ms"]
-            }
-            for task in top_tasks
+            {"name": name, "dur_ms": dur_ms, "ts_ms": ts_ms}
+            for name, dur_ms, ts_ms, _ in top_tasks
         ]
-
-        assumption = (
-            f"Long tasks detected as slices with dur >= {threshold_ms}ms. "
-            "Note: UI thread attribution not yet implemented (planned for Week A2)"
-        )
+        self._long_tasks[cache_key] = (total_count, top_list)
         return total_count, top_list, assumption
 
     def get_frame_summary(self, assumptions: dict) -> tuple[int | None, int | None, str]:
@@ -945,36 +1295,13 @@ class PerfettoAnalyzer:
         Returns:
             Tuple of (total_frames, janky_frames, assumption_note)
         """
-        # Count total doFrame slices
-        total_result = _safe_q(
-            self.tp,
-            """
-            SELECT COUNT(*) AS total
-            FROM slice
-            WHERE name LIKE '%doFrame%'
-            """,
-            "frames",
-            assumptions
-        )
-
-        total_frames = total_result[0]["total"] if total_result else 0
-
-        if total_frames == 0:
+        metrics = self._trace_metrics(assumptions)
+        total_frames = metrics.get("frame_total")
+        if not total_frames:
             return None, None, "No doFrame slices found in trace"
 
-        # Count janky frames (duration > 16ms, which is ~60fps)
-        janky_result = _safe_q(
-            self.tp,
-            """
-            SELECT COUNT(*) AS janky
-            FROM slice
-            WHERE name LIKE '%doFrame%' AND dur / 1e6 > 16
-            """,
-            "frames",
-            assumptions
-        )
-
-        janky_frames = janky_result[0]["janky"] if janky_result else 0
+        # Janky frames have duration > 16ms, which is ~60fps
+        janky_frames = metrics.get("frame_janky") or 0
 
         assumption = (
             "Frames counted from doFrame slices. Janky defined as dur > 16ms (60fps threshold). "
@@ -983,124 +1310,218 @@ class PerfettoAnalyzer:
         return total_frames, janky_frames, assumption
 
 
+# Pooled trace processors outlive individual analyzers; stop their shells on exit
+atexit.register(PerfettoAnalyzer.shutdown_all)
+
+
 def analyze_trace(
     trace_path: str,
     long_task_ms: int,
     top_n: int,
     focus_process: str | None,
-    schema_version: str
+    schema_version: str,
+    features: Iterable[str] | None = None,
+    include_assumptions: bool = True
 ) -> dict:
     """
     Analyze a Perfetto trace and return structured results.
 
+    Results are memoized per (trace file mtime/size, arguments); a modified
+    trace is re-analyzed. Each call returns its own copy of the result. When
+    PERFETTO_AGENT_CACHE_DIR is set, results are also persisted there and
+    shared across processes. Runs in which a query failed are never cached.
+
     Args:
         trace_path: Path to the trace file
         long_task_ms: Threshold for identifying long tasks
         top_n: Number of top long tasks to include
+        features: Optional subset of ANALYSIS_FEATURES to compute; the others are
+            reported as None. Defaults to all of them.
+        include_assumptions: When False, "assumptions" is emitted empty and its
+            default notes are never built, for consumers that do not read them.
 
     Returns:
         Dictionary with analysis results following the required schema
     """
-    analyzer = PerfettoAnalyzer(trace_path)
+    if features is None:
+        selected = ANALYSIS_FEATURES
+    else:
+        requested = set(features)
+        unknown = requested.difference(ANALYSIS_FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown analysis features: {', '.join(sorted(unknown))}")
+        # Canonical order keeps equivalent requests on one cache entry
+        selected = tuple(name for name in ANALYSIS_FEATURES if name in requested)
+
+    stat = os.stat(trace_path)
+    result = _cached_analysis(
+        trace_path,
+        stat.st_mtime_ns,
+        stat.st_size,
+        long_task_ms,
+        top_n,
+        focus_process,
+        schema_version,
+        selected,
+        include_assumptions
+    )
+    return _copy_result(result)
+
+
+# Bump when the result shape changes so persisted entries from older builds are ignored
+_CACHE_FORMAT = 1
+# Finished analyses in this process, keyed by the _cached_analysis arguments.
+_RESULT_CACHE_SIZE = 32
+_RESULT_CACHE: OrderedDict[tuple, dict] = OrderedDict()
+_RESULT_LOCK = threading.Lock()
+
+
+def _cached_analysis(
+    trace_path: str,
+    mtime_ns: int,
+    size: int,
+    long_task_ms: int,
+    top_n: int,
+    focus_process: str | None,
+    schema_version: str,
+    features: tuple[str, ...],
+    include_assumptions: bool
+) -> dict:
+    """
+    Return the analysis for these arguments from memory, disk or a fresh run.
+
+    Runs in which any query failed are returned but never cached, so a transient
+    trace_processor error is retried next time instead of being served forever.
+    """
+    # mtime_ns and size only take part in the cache key
+    key = (
+        trace_path, mtime_ns, size, long_task_ms, top_n, focus_process,
+        schema_version, features, include_assumptions
+    )
+    with _RESULT_LOCK:
+        result = _RESULT_CACHE.get(key)
+        if result is not None:
+            _RESULT_CACHE.move_to_end(key)
+            return result
+
+    cache_file = _disk_cache_file(
+        (_CACHE_FORMAT, __version__, os.path.abspath(trace_path)) + key
+    )
+    result = None
+    if cache_file is not None:
+        try:
+            with open(cache_file, "rb") as handle:
+                result = orjson.loads(handle.read())
+        except (OSError, orjson.JSONDecodeError):
+            pass
+
+    if result is None:
+        result, degraded = _analyze(
+            trace_path, long_task_ms, top_n, focus_process, schema_version, features,
+            include_assumptions
+        )
+        if degraded:
+            return result
+        if cache_file is not None:
+            _write_cache_file(cache_file, result)
+
+    with _RESULT_LOCK:
+        _RESULT_CACHE[key] = result
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+    return result
 
+
+def _write_cache_file(cache_file: str, result: dict) -> None:
+    """
+    Persist a result atomically; a unique temp file per call keeps concurrent writers apart.
+    """
+    tmp_file = None
     try:
-        assumptions: dict = {}
+        cache_dir = os.path.dirname(cache_file)
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, prefix=os.path.basename(cache_file) + ".", suffix=".tmp", delete=False
+        ) as handle:
+            tmp_file = handle.name
+            handle.write(orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        if tmp_file is not None:
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+
+
+def _copy_result(value):
+    """
+    Copy a cached analysis so callers may mutate what they get back.
 
-        # Extract metadata
-        trace_duration_ms = analyzer.get_trace_duration_ms(assumptions)
-        processes = analyzer.get_processes(assumptions)
+    Results are plain JSON-shaped dicts and lists, so a direct rebuild does the job
+    of copy.deepcopy without its per-object memo and dispatch overhead.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(item) for item in value]
+    return value
 
-        focus_pid = analyzer.resolve_focus_pid(focus_process, assumptions)
-        main_thread = analyzer.resolve_main_thread(focus_pid, assumptions)
 
-        # Extract startup time
-        startup_ms, startup_assumption = analyzer.get_startup_ms(assumptions)
-        earliest_ms = analyzer.get_earliest_slice_ms(assumptions)
+def _disk_cache_file(key: tuple) -> str | None:
+    """
+    Return the on-disk cache entry for an analysis key, if PERFETTO_AGENT_CACHE_DIR is set.
+    """
+    cache_dir = os.getenv("PERFETTO_AGENT_CACHE_DIR")
+    if not cache_dir:
+        return None
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(os.path.expanduser(cache_dir), f"{digest}.json")
 
-        # Extract long tasks with attribution
-        long_task_count, long_task_top, long_task_assumption = analyzer.get_ui_thread_long_tasks(
-            long_task_ms,
-            top_n,
-            main_thread,
-            focus_pid,
-            assumptions
-        )
-        long_slices_attributed = analyzer.get_long_slices_attributed(
-            long_task_ms,
-            top_n,
-            focus_pid,
-            assumptions
-        )
-        app_sections = analyzer.get_app_sections(focus_pid, assumptions)
-
-        # Extract frame features
-        frame_features = analyzer.get_frame_features(assumptions)
-        cpu_features = analyzer.get_cpu_features(focus_pid, assumptions)
-        startup_fallback_ms = 1800.0
-        steady_state_window_ms = 5000.0
-        if startup_ms is None:
-            _set_assumption(
-                assumptions,
-                "time_windows",
-                "Startup window uses fallback because startup_ms is missing"
-            )
-            startup_end_ms = startup_fallback_ms
-            startup_method = "fallback_1800ms"
-        else:
-            startup_end_ms = startup_ms
-            startup_method = "startup_ms"
-
-        time_windows = {
-            "startup": {
-                "start_ms": 0.0,
-                "end_ms": startup_end_ms,
-                "method": startup_method
-            },
-            "steady_state": {
-                "start_ms": startup_end_ms,
-                "end_ms": startup_end_ms + steady_state_window_ms,
-                "method": "startup_end + 5000ms"
-            }
-        }
-        window_breakdown = analyzer.get_window_breakdown(
-            time_windows,
-            focus_pid,
-            main_thread,
-            earliest_ms,
-            assumptions
-        )
 
-        suspects = []
-        seen_labels: set[str] = set()
-        for window_name in ["startup", "steady_state"]:
-            window_breakdown_entry = window_breakdown.get(window_name, {})
-            blocking = window_breakdown_entry.get("main_thread_blocking_ms", {})
-            if blocking:
-                blocking_normalized = {
-                    key.replace("_ms", ""): value for key, value in blocking.items()
-                }
-                category, value, reason = _dominant_category_value(blocking_normalized)
-                if reason:
-                    _set_assumption(assumptions, f"{window_name}_main_thread_blocking", reason)
-                if category and value is not None and category != "app":
-                    label = f"{window_name.capitalize()} main thread dominated by {category} work"
-                    if label not in seen_labels:
-                        suspects.append(
-                            {
-                                "label": label,
-                                "window": window_name,
-                                "category": category,
-                                "evidence": {f"{category}_ms": value}
-                            }
-                        )
-                        seen_labels.add(label)
-
-            by_category = window_breakdown_entry.get("by_category_ms", {})
-            category, value, reason = _dominant_category_value(by_category)
+def _submit_noted(pool: ThreadPoolExecutor, method, *args) -> tuple:
+    """
+    Submit an analyzer method with a private assumptions dict as its last argument.
+    """
+    notes: dict = {}
+    return pool.submit(method, *args, notes), notes
+
+
+def _collect_noted(task: tuple | bool, assumptions: dict):
+    """
+    Wait for a task from _submit_noted and fold its notes into assumptions.
+
+    Collecting in call order keeps the notes identical, keys and order alike, to
+    running the methods one after another. A task that was never submitted
+    (False) collects as None.
+    """
+    if not task:
+        return None
+    future, notes = task
+    result = future.result()
+    _merge_assumptions(assumptions, notes)
+    return result
+
+
+def _window_suspects(window_breakdown: dict, assumptions: dict) -> list[dict]:
+    """
+    Derive suspects from the dominant non-app categories of each time window.
+    """
+    suspects = []
+    seen_labels: set[str] = set()
+    for window_name in ("startup", "steady_state"):
+        window_breakdown_entry = window_breakdown[window_name]
+        blocking = window_breakdown_entry["main_thread_blocking_ms"]
+        if blocking:
+            blocking_normalized = {
+                key.replace("_ms", ""): value for key, value in blocking.items()
+            }
+            category, value, reason = _dominant_category_value(blocking_normalized)
             if reason:
-                _set_assumption(assumptions, f"{window_name}_dominant_category", reason)
+                _set_assumption(assumptions, f"{window_name}_main_thread_blocking", reason)
             if category and value is not None and category != "app":
-                label = f"{window_name.capitalize()} dominated by {category} work"
+                label = f"{window_name.capitalize()} main thread dominated by {category} work"
                 if label not in seen_labels:
                     suspects.append(
                         {
@@ -1111,63 +1532,193 @@ def analyze_trace(
                         }
                     )
                     seen_labels.add(label)
-        suspects, filtered = _prefer_non_unknown_suspects(suspects)
-        if not suspects:
-            _set_assumption(assumptions, "suspects", "No suspects generated")
-        elif not filtered:
-            _set_assumption(
-                assumptions,
-                "suspects",
-                "Only unknown-category suspects available"
+
+        by_category = window_breakdown_entry["by_category_ms"]
+        category, value, reason = _dominant_category_value(by_category)
+        if reason:
+            _set_assumption(assumptions, f"{window_name}_dominant_category", reason)
+        if category and value is not None and category != "app":
+            label = f"{window_name.capitalize()} dominated by {category} work"
+            if label not in seen_labels:
+                suspects.append(
+                    {
+                        "label": label,
+                        "window": window_name,
+                        "category": category,
+                        "evidence": {f"{category}_ms": value}
+                    }
+                )
+                seen_labels.add(label)
+    suspects, filtered = _prefer_non_unknown_suspects(suspects)
+    if not suspects:
+        _set_assumption(assumptions, "suspects", "No suspects generated")
+    elif not filtered:
+        _set_assumption(
+            assumptions,
+            "suspects",
+            "Only unknown-category suspects available"
+        )
+    return suspects
+
+
+def _analyze(
+    trace_path: str,
+    long_task_ms: int,
+    top_n: int,
+    focus_process: str | None,
+    schema_version: str,
+    features: tuple[str, ...],
+    include_assumptions: bool
+) -> tuple[dict, bool]:
+    """
+    Run the analysis; the flag is True when any query failed along the way.
+    """
+    analyzer = PerfettoAnalyzer(trace_path)
+
+    try:
+        assumptions: dict = {}
+
+        # One pool for the whole run: each task is submitted as soon as the values it
+        # needs are known, and collected in the original order to keep notes stable.
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            # Duration and processes share one batched query, so processes is read after.
+            trace_duration_task = _submit_noted(pool, analyzer.get_trace_duration_ms)
+            focus_pid_task = _submit_noted(pool, analyzer.resolve_focus_pid, focus_process)
+            trace_duration_ms = _collect_noted(trace_duration_task, assumptions)
+            focus_pid = _collect_noted(focus_pid_task, assumptions)
+
+            # Features that need only focus_pid overlap with main-thread resolution.
+            # Features the caller did not ask for are never submitted and collect as None.
+            long_slices_task = "long_slices_attributed" in features and _submit_noted(
+                pool, analyzer.get_long_slices_attributed, long_task_ms, top_n, focus_pid
+            )
+            app_sections_task = "app_sections" in features and _submit_noted(
+                pool, analyzer.get_app_sections, focus_pid
+            )
+            frame_features_task = "frame_features" in features and _submit_noted(
+                pool, analyzer.get_frame_features
+            )
+            cpu_features_task = "cpu_features" in features and _submit_noted(
+                pool, analyzer.get_cpu_features, focus_pid
+            )
+
+            processes = analyzer.get_processes(assumptions)
+
+            main_thread = analyzer.resolve_main_thread(focus_pid, assumptions)
+
+            # Extract startup time (reads the trace metrics fetched with the duration)
+            startup_ms, startup_assumption = analyzer.get_startup_ms(assumptions)
+            earliest_ms = analyzer.get_earliest_slice_ms(assumptions)
+
+            startup_fallback_ms = 1800.0
+            steady_state_window_ms = 5000.0
+            if startup_ms is None:
+                startup_end_ms = startup_fallback_ms
+                startup_method = "fallback_1800ms"
+            else:
+                startup_end_ms = startup_ms
+                startup_method = "startup_ms"
+
+            time_windows = {
+                "startup": {
+                    "start_ms": 0.0,
+                    "end_ms": startup_end_ms,
+                    "method": startup_method
+                },
+                "steady_state": {
+                    "start_ms": startup_end_ms,
+                    "end_ms": startup_end_ms + steady_state_window_ms,
+                    "method": "startup_end + 5000ms"
+                }
+            }
+
+            long_tasks_task = _submit_noted(
+                pool, analyzer.get_ui_thread_long_tasks, long_task_ms, top_n, main_thread, focus_pid
+            )
+            window_breakdown_task = "window_breakdown" in features and _submit_noted(
+                pool, analyzer.get_window_breakdown, time_windows, focus_pid, main_thread, earliest_ms
+            )
+            work_breakdown_task = "work_breakdown" in features and _submit_noted(
+                pool, analyzer.get_work_breakdown, long_task_ms, focus_pid, main_thread
             )
-        work_breakdown = analyzer.get_work_breakdown(long_task_ms, focus_pid, main_thread, assumptions)
+
+            # Extract long tasks with attribution
+            long_task_count, long_task_top, long_task_assumption = _collect_noted(
+                long_tasks_task, assumptions
+            )
+            long_slices_attributed = _collect_noted(long_slices_task, assumptions)
+            app_sections = _collect_noted(app_sections_task, assumptions)
+
+            # Extract frame features
+            frame_features = _collect_noted(frame_features_task, assumptions)
+            cpu_features = _collect_noted(cpu_features_task, assumptions)
+            if startup_ms is None:
+                _set_assumption(
+                    assumptions,
+                    "time_windows",
+                    "Startup window uses fallback because startup_ms is missing"
+                )
+            window_breakdown = _collect_noted(window_breakdown_task, assumptions)
+
+        suspects = None
+        if window_breakdown is not None:
+            suspects = _window_suspects(window_breakdown, assumptions)
+        work_breakdown = _collect_noted(work_breakdown_task, assumptions)
 
         # Initialize result with required schema
-        top_app_sections = [
-            entry["name"]
-            for entry in app_sections.get("top_by_total_ms", [])
-            if entry.get("name")
-        ][:3]
+        top_app_sections = None
+        if app_sections is not None:
+            top_app_sections = [
+                entry["name"]
+                for entry in app_sections["top_by_total_ms"]
+                if entry["name"]
+            ][:3]
         top_long_slice_name = None
-        if long_slices_attributed.get("top"):
-            top_long_slice_name = long_slices_attributed["top"][0].get("name")
-
-        dominant_work_category, dominant_reason = _dominant_category(
-            work_breakdown.get("by_category_ms", {})
-        )
-        if dominant_reason:
-            _set_assumption(assumptions, "dominant_work_category", dominant_reason)
+        if long_slices_attributed and long_slices_attributed["top"]:
+            top_long_slice_name = long_slices_attributed["top"][0]["name"]
 
+        dominant_work_category = None
         main_thread_blocked_by = None
-        blocking = work_breakdown.get("main_thread_blocking", {})
-        if blocking:
-            blocking_normalized = {
-                key.replace("_ms", ""): value for key, value in blocking.items()
-            }
-            main_thread_blocked_by, blocked_reason = _dominant_category(blocking_normalized)
-            if blocked_reason:
-                _set_assumption(assumptions, "main_thread_blocked_by", blocked_reason)
-        else:
-            _set_assumption(
-                assumptions,
-                "main_thread_blocked_by",
-                "No main thread blocking breakdown available"
+        if work_breakdown is not None:
+            dominant_work_category, dominant_reason = _dominant_category(
+                work_breakdown["by_category_ms"]
             )
+            if dominant_reason:
+                _set_assumption(assumptions, "dominant_work_category", dominant_reason)
 
-        startup_dominant_category, startup_reason = _dominant_category(
-            window_breakdown.get("startup", {}).get("by_category_ms", {})
-        )
-        if startup_reason:
-            _set_assumption(assumptions, "startup_dominant_category", startup_reason)
-        steady_dominant_category, steady_reason = _dominant_category(
-            window_breakdown.get("steady_state", {}).get("by_category_ms", {})
-        )
-        if steady_reason:
-            _set_assumption(assumptions, "steady_state_dominant_category", steady_reason)
+            blocking = work_breakdown["main_thread_blocking"]
+            if blocking:
+                blocking_normalized = {
+                    key.replace("_ms", ""): value for key, value in blocking.items()
+                }
+                main_thread_blocked_by, blocked_reason = _dominant_category(blocking_normalized)
+                if blocked_reason:
+                    _set_assumption(assumptions, "main_thread_blocked_by", blocked_reason)
+            else:
+                _set_assumption(
+                    assumptions,
+                    "main_thread_blocked_by",
+                    "No main thread blocking breakdown available"
+                )
+
+        startup_dominant_category = None
+        steady_dominant_category = None
+        top_suspect = None
+        if window_breakdown is not None:
+            startup_dominant_category, startup_reason = _dominant_category(
+                window_breakdown["startup"]["by_category_ms"]
+            )
+            if startup_reason:
+                _set_assumption(assumptions, "startup_dominant_category", startup_reason)
+            steady_dominant_category, steady_reason = _dominant_category(
+                window_breakdown["steady_state"]["by_category_ms"]
+            )
+            if steady_reason:
+                _set_assumption(assumptions, "steady_state_dominant_category", steady_reason)
 
-        top_suspect = suspects[0]["label"] if suspects else None
-        if top_suspect is None:
-            _set_assumption(assumptions, "top_suspect", "No suspects generated")
+            top_suspect = suspects[0]["label"] if suspects else None
+            if top_suspect is None:
+                _set_assumption(assumptions, "top_suspect", "No suspects generated")
 
         result = {
             "schema_version": schema_version,
@@ -1179,7 +1730,9 @@ def analyze_trace(
             "startup_ms": startup_ms,
             "threads": {
                 "main_thread": main_thread,
-                "top_threads_by_slice_ms": cpu_features.get("top_threads_by_slice_ms", [])
+                "top_threads_by_slice_ms": (
+                    cpu_features["top_threads_by_slice_ms"] if cpu_features is not None else None
+                )
             },
             "ui_thread_long_tasks": {
                 "threshold_ms": long_task_ms,
@@ -1208,46 +1761,31 @@ def analyze_trace(
             },
             "assumptions": assumptions
         }
-        _set_assumption(
-            result["assumptions"],
-            "trace_duration",
-            "Calculated from trace_bounds table (end_ts - start_ts)"
-        )
-        _set_assumption(
-            result["assumptions"],
-            "processes",
-            "Extracted from process table, limited to 20 entries"
-        )
-        _set_assumption(result["assumptions"], "startup", startup_assumption)
-        _set_assumption(result["assumptions"], "long_tasks", long_task_assumption)
-        _set_assumption(
-            result["assumptions"],
-            "frames",
-            "Frame features computed from doFrame slices (p95/jank best-effort)"
-        )
-        _set_assumption(
-            result["assumptions"],
-            "classification",
-            "Classification is pid+name token based and best-effort; unknown used when uncertain."
-        )
-        if focus_process and focus_pid is None:
-            _set_assumption(
-                result["assumptions"],
-                "focus_process",
-                f"No matching process found for focus_process={focus_process}"
+        degraded = any(note.startswith("Query failed") for note in assumptions.values())
+        if not include_assumptions:
+            result["assumptions"] = {}
+            return result, degraded
+        defaults = {
+            "trace_duration": "Calculated from trace_bounds table (end_ts - start_ts)",
+            "processes": "Extracted from process table, limited to 20 entries",
+            "startup": startup_assumption,
+            "long_tasks": long_task_assumption,
+            "frames": "Frame features computed from doFrame slices (p95/jank best-effort)",
+            "classification": (
+                "Classification is pid+name token based and best-effort; unknown used when uncertain."
             )
+        }
+        if focus_process and focus_pid is None:
+            defaults["focus_process"] = f"No matching process found for focus_process={focus_process}"
         if focus_pid is None:
-            _set_assumption(
-                result["assumptions"],
-                "main_thread",
-                "Main thread not resolved because focus_pid is null"
-            )
+            defaults["main_thread"] = "Main thread not resolved because focus_pid is null"
         elif main_thread is None:
-            _set_assumption(
-                result["assumptions"],
-                "main_thread",
-                f"Main thread not found for pid={focus_pid}"
-            )
-        return result
+            defaults["main_thread"] = f"Main thread not found for pid={focus_pid}"
+        skipped = [name for name in ANALYSIS_FEATURES if name not in features]
+        if skipped:
+            defaults["features"] = f"Not computed on request: {', '.join(skipped)}"
+        # Notes recorded while querying take precedence
+        _merge_assumptions(assumptions, defaults)
+        return result, degraded
     finally:
         analyzer.close()
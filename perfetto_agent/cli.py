@@ -1,17 +1,39 @@
 """CLI entry point for Perfetto Baseline Analyzer."""
 
+import os
+import re
+import stat
+import sys
 import typer
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
-from rich.console import Console
-from perfetto_agent.analyzer import analyze_trace
-from perfetto_agent.explain import run_explain
+from perfetto_agent.analyzer import PerfettoAnalyzer, analyze_trace
+from perfetto_agent.output import read_json, write_explanation, write_json
 
 app = typer.Typer(
     help="Perfetto Baseline Analyzer - Analyze Android performance traces",
     no_args_is_help=True
 )
-console = Console()
+_CONSOLE = None
+# Only the style tags this CLI emits, so bracketed user text survives
+_MARKUP_RE = re.compile(r"\[/?(?:blue|green|red)\]")
+
+
+def _console():
+    global _CONSOLE
+    if _CONSOLE is None:
+        from rich.console import Console
+
+        _CONSOLE = Console(highlight=False)
+    return _CONSOLE
+
+
+def _echo(message: str) -> None:
+    # Redirected output gets plain text; rich is only set up for a terminal
+    if not sys.stdout.isatty():
+        print(_MARKUP_RE.sub("", message))
+        return
+    _console().print(message)
 
 
 @app.callback(invoke_without_command=True)
@@ -32,26 +54,28 @@ def analyze(
     schema_version: str = typer.Option("A2", "--schema-version", help="Schema version to emit in JSON"),
     explain: bool = typer.Option(False, "--explain", help="Generate LLM explanation output"),
     explain_out: Path = typer.Option("explanation.md", "--explain-out", help="Explanation Markdown output path"),
+    feature: Optional[List[str]] = typer.Option(
+        None, "--feature", help="Only compute this analysis feature (repeatable; default: all)"
+    ),
+    no_assumptions: bool = typer.Option(
+        False, "--no-assumptions", help="Emit an empty assumptions block (for non-human consumers)"
+    ),
 ):
     """Analyze a Perfetto trace and generate analysis.json."""
 
     # Validate trace file exists
-    if not trace.exists():
-        console.print(f"[red]Error:[/red] Trace file not found: {trace}")
-        raise typer.Exit(code=1)
-
-    if not trace.is_file():
-        console.print(f"[red]Error:[/red] Path is not a file: {trace}")
-        raise typer.Exit(code=1)
-
-    console.print(f"[blue]Analyzing trace:[/blue] {trace}")
-    console.print(f"[blue]Output file:[/blue] {out}")
-    console.print(f"[blue]Long task threshold:[/blue] {long_task_ms}ms")
-    console.print(f"[blue]Top N tasks:[/blue] {top_n}")
-    console.print(f"[blue]Focus process:[/blue] {focus_process}")
-    console.print(f"[blue]Schema version:[/blue] {schema_version}")
+    _require_file(trace, "Trace")
+
+    _echo(f"[blue]Analyzing trace:[/blue] {trace}")
+    _echo(f"[blue]Output file:[/blue] {out}")
+    _echo(f"[blue]Long task threshold:[/blue] {long_task_ms}ms")
+    _echo(f"[blue]Top N tasks:[/blue] {top_n}")
+    _echo(f"[blue]Focus process:[/blue] {focus_process}")
+    _echo(f"[blue]Schema version:[/blue] {schema_version}")
+    if feature:
+        _echo(f"[blue]Features:[/blue] {', '.join(feature)}")
     if explain:
-        console.print(f"[blue]Explain output:[/blue] {explain_out}")
+        _echo(f"[blue]Explain output:[/blue] {explain_out}")
 
     # Run analysis
     try:
@@ -60,40 +84,47 @@ def analyze(
             long_task_ms=long_task_ms,
             top_n=top_n,
             focus_process=focus_process,
-            schema_version=schema_version
+            schema_version=schema_version,
+            features=feature or None,
+            include_assumptions=not no_assumptions
         )
 
         # Write output
-        import json
-        with open(out, 'w') as f:
-            json.dump(result, f, indent=2)
+        write_json(out, result)
 
-        console.print(f"[green]✓[/green] Analysis complete: {out}")
+        _echo(f"[green]✓[/green] Analysis complete: {out}")
 
         if explain:
             _run_explain(result, None, explain_out)
 
     except Exception as e:
-        console.print(f"[red]Error during analysis:[/red] {e}")
+        _echo(f"[red]Error during analysis:[/red] {e}")
+        raise typer.Exit(code=1)
+    finally:
+        PerfettoAnalyzer.shutdown_all()
+
+
+def _require_file(path: Path, label: str) -> None:
+    # One stat per path; S_ISREG covers both the exists and is_file checks
+    try:
+        mode = os.stat(path).st_mode
+    except (FileNotFoundError, NotADirectoryError):
+        _echo(f"[red]Error:[/red] {label} file not found: {path}")
+        raise typer.Exit(code=1)
+    if not stat.S_ISREG(mode):
+        _echo(f"[red]Error:[/red] Path is not a file: {path}")
         raise typer.Exit(code=1)
 
 
 def _run_explain(analysis_data: dict, baseline_data: dict | None, out: Path) -> None:
-    llm_input, llm_output, markdown = run_explain(analysis_data, baseline_data)
-    json_out = out.with_suffix(".json")
-    input_out = out.with_name("llm_input.json")
+    from perfetto_agent.explain import run_explain
 
-    import json
-    with open(json_out, "w") as f:
-        json.dump(llm_output, f, indent=2)
-    with open(input_out, "w") as f:
-        json.dump(llm_input, f, indent=2)
-    with open(out, "w") as f:
-        f.write(markdown)
+    llm_input, llm_output, markdown = run_explain(analysis_data, baseline_data)
+    json_out, input_out = write_explanation(out, llm_input, llm_output, markdown)
 
-    console.print(f"[green]✓[/green] Explanation written to: {out}")
-    console.print(f"[green]✓[/green] Explanation JSON written to: {json_out}")
-    console.print(f"[green]✓[/green] LLM input written to: {input_out}")
+    _echo(f"[green]✓[/green] Explanation written to: {out}")
+    _echo(f"[green]✓[/green] Explanation JSON written to: {json_out}")
+    _echo(f"[green]✓[/green] LLM input written to: {input_out}")
 
 
 @app.command()
@@ -103,23 +134,14 @@ def explain(
     out: Path = typer.Option("explanation.md", "--out", help="Output Markdown file path")
 ):
     """Generate an LLM explanation from analysis JSON."""
-    for path in [analysis, baseline]:
-        if path is None:
-            continue
-        if not path.exists():
-            console.print(f"[red]Error:[/red] Analysis file not found: {path}")
-            raise typer.Exit(code=1)
-        if not path.is_file():
-            console.print(f"[red]Error:[/red] Path is not a file: {path}")
-            raise typer.Exit(code=1)
-
-    import json
-    with open(analysis, "r") as f:
-        analysis_data = json.load(f)
+    for path in (analysis, baseline):
+        if path is not None:
+            _require_file(path, "Analysis")
+
+    analysis_data = read_json(analysis)
     baseline_data = None
     if baseline is not None:
-        with open(baseline, "r") as f:
-            baseline_data = json.load(f)
+        baseline_data = read_json(baseline)
 
     _run_explain(analysis_data, baseline_data, out)
 
@@ -1,11 +1,6 @@
 """LLM explanation utilities."""
 
-from perfetto_agent.explain.llm import (
-    build_llm_input,
-    render_markdown,
-    run_explain,
-    validate_llm_output
-)
+import importlib
 
 __all__ = [
     "build_llm_input",
@@ -13,3 +8,10 @@ __all__ = [
     "run_explain",
     "validate_llm_output"
 ]
+
+
+def __getattr__(name: str):
+    # Loaded on first use so importing the package does not pull in requests
+    if name in __all__:
+        return getattr(importlib.import_module("perfetto_agent.explain.llm"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
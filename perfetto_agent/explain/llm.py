@@ -2,18 +2,22 @@
 
 from __future__ import annotations
 
-import json
+import functools
+import hashlib
 import os
 import time
 import sys
-import requests
+import orjson
 import urllib.error
+from pathlib import Path
 from typing import Any
 
 
 DEFAULT_MODEL = "gpt-4o"
 LLM_TIMEOUT_SECONDS = 30
 LLM_MAX_RETRIES = 4
+# Seconds to wait before retry N: 1 + 2**N
+_BACKOFF_SECONDS = tuple(1.0 + (2 ** attempt) for attempt in range(LLM_MAX_RETRIES))
 
 
 def _trim_list(value: Any, limit: int) -> list:
@@ -24,41 +28,47 @@ def _trim_list(value: Any, limit: int) -> list:
 
 def build_llm_input(analysis: dict, baseline: dict | None = None) -> dict:
     def extract(source: dict) -> dict:
-        features = source.get("features", {}) if isinstance(source, dict) else {}
+        if not isinstance(source, dict):
+            source = {}
+        features = source.get("features") or {}
+        long_slices = features.get("long_slices_attributed") or {}
+        app_sections = features.get("app_sections") or {}
         return {
-            "summary": source.get("summary", {}) if isinstance(source, dict) else {},
+            "summary": source.get("summary", {}),
             "features": {
                 "time_windows": features.get("time_windows"),
                 "window_breakdown": features.get("window_breakdown"),
                 "work_breakdown": features.get("work_breakdown"),
                 "suspects": _trim_list(features.get("suspects"), 5),
                 "long_slices_attributed": {
-                    "top": _trim_list(
-                        (features.get("long_slices_attributed") or {}).get("top"),
-                        10
-                    )
+                    "top": _trim_list(long_slices.get("top"), 10)
                 },
                 "app_sections": {
-                    "top_by_total_ms": _trim_list(
-                        (features.get("app_sections") or {}).get("top_by_total_ms"),
-                        5
-                    )
+                    "top_by_total_ms": _trim_list(app_sections.get("top_by_total_ms"), 5)
                 }
             },
-            "assumptions": source.get("assumptions", {}) if isinstance(source, dict) else {}
+            "assumptions": source.get("assumptions", {})
         }
 
     payload = {
         "current": extract(analysis)
     }
 
-    if baseline is not None:
+    if baseline is analysis:
+        # Self-diff: same extract on both sides and nothing to subtract
+        payload["baseline"] = payload["current"]
+        payload["deltas"] = _unchanged_deltas(payload["current"])
+    elif baseline is not None:
         payload["baseline"] = extract(baseline)
         payload["deltas"] = compute_deltas(payload["current"], payload["baseline"])
 
     return payload
 
 
+_DELTA_WINDOWS = ("startup", "steady_state")
+_DELTA_CATEGORIES = ("app", "framework", "system", "unknown")
+
+
 def compute_deltas(current: dict, baseline: dict) -> dict:
     deltas: dict[str, Any] = {}
     current_summary = current.get("summary", {})
@@ -78,43 +88,70 @@ def compute_deltas(current: dict, baseline: dict) -> dict:
         }
     }
 
-    def extract_by_category(window_data: dict) -> dict:
-        return window_data.get("by_category_ms") or {}
-
-    current_windows = (current.get("features") or {}).get("window_breakdown") or {}
-    baseline_windows = (baseline.get("features") or {}).get("window_breakdown") or {}
+    current_window = ((current.get("features") or {}).get("window_breakdown") or {}).get
+    baseline_window = ((baseline.get("features") or {}).get("window_breakdown") or {}).get
     window_deltas = {}
-    for window_name in ["startup", "steady_state"]:
-        current_totals = extract_by_category(current_windows.get(window_name, {}))
-        baseline_totals = extract_by_category(baseline_windows.get(window_name, {}))
-        delta_entry = {}
-        for category in ["app", "framework", "system", "unknown"]:
-            delta_entry[category] = float(current_totals.get(category, 0.0) or 0.0) - float(
-                baseline_totals.get(category, 0.0) or 0.0
-            )
-        window_deltas[window_name] = delta_entry
+    for window_name in _DELTA_WINDOWS:
+        current_totals = (current_window(window_name) or {}).get("by_category_ms") or {}
+        baseline_totals = (baseline_window(window_name) or {}).get("by_category_ms") or {}
+        current_total = current_totals.get
+        baseline_total = baseline_totals.get
+        window_deltas[window_name] = {
+            category: float(current_total(category) or 0.0) - float(baseline_total(category) or 0.0)
+            for category in _DELTA_CATEGORIES
+        }
     deltas["window_category_deltas_ms"] = window_deltas
     return deltas
 
 
-def _system_prompt() -> str:
-    return (
-        "You are a performance narrator. "
-        "Use only the provided JSON input. "
-        "Every claim must include evidence paths. "
-        "If evidence is missing, say 'insufficient evidence' and list missing fields. "
-        "No fixes or optimizations; only next inspection steps. "
-        "Keep output concise and technical."
-    )
+def _unchanged_deltas(current: dict) -> dict:
+    summary = current.get("summary", {})
+    return {
+        "summary_changes": {
+            key: {"baseline": summary.get(key), "current": summary.get(key)}
+            for key in ("startup_dominant_category", "steady_state_dominant_category", "top_suspect")
+        },
+        "window_category_deltas_ms": {
+            window_name: dict.fromkeys(_DELTA_CATEGORIES, 0.0) for window_name in _DELTA_WINDOWS
+        }
+    }
+
+
+_SYSTEM_PROMPT = (
+    "You are a performance narrator. "
+    "Use only the provided JSON input. "
+    "Every claim must include evidence paths. "
+    "If evidence is missing, say 'insufficient evidence' and list missing fields. "
+    "No fixes or optimizations; only next inspection steps. "
+    "Keep output concise and technical."
+)
+
+_USER_PROMPT_PREFIX = (
+    "Return JSON with keys: title, high_level, key_findings, suspects, "
+    "next_steps, limitations. Each list item must include text and evidence "
+    "(list of JSON paths). Use only the provided JSON input:\n"
+)
 
 
 def _user_prompt(llm_input: dict) -> str:
-    return (
-        "Return JSON with keys: title, high_level, key_findings, suspects, "
-        "next_steps, limitations. Each list item must include text and evidence "
-        "(list of JSON paths). Use only the provided JSON input:\n"
-        f"{json.dumps(llm_input, indent=2)}"
-    )
+    # Compact JSON: the model does not need indentation and it costs tokens
+    return _USER_PROMPT_PREFIX + orjson.dumps(llm_input).decode()
+
+
+@functools.lru_cache(maxsize=None)
+def _session():
+    """
+    Shared HTTP session so retries and later explain calls reuse one TLS connection.
+
+    Retries stay in call_openai, which honours Retry-After, so the adapter never retries.
+    requests is imported here so the analyze path never pays for it.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+    return session
 
 
 def call_openai(llm_input: dict) -> dict:
@@ -126,43 +163,45 @@ def call_openai(llm_input: dict) -> dict:
     payload = {
         "model": model,
         "messages": [
-            {"role": "system", "content": _system_prompt()},
+            {"role": "system", "content": _SYSTEM_PROMPT},
             {"role": "user", "content": _user_prompt(llm_input)}
         ],
         "temperature": 0.0
     }
 
-    data = json.dumps(payload).encode("utf-8")
+    # Encoded once; every retry resends the same bytes
+    data = orjson.dumps(payload)
     url = "https://api.openai.com/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
 
+    debug = bool(os.getenv("PERFETTO_LLM_DEBUG"))
     last_error = None
     for attempt in range(LLM_MAX_RETRIES):
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=LLM_TIMEOUT_SECONDS)
-            print(f"STATUS: {resp.status_code}", file=sys.stderr)
-            print(f"CONTENT-TYPE: {resp.headers.get('content-type')}", file=sys.stderr)
-            print(f"BODY (first 500): {resp.text[:500]}", file=sys.stderr)
+            resp = _session().post(url, headers=headers, data=data, timeout=LLM_TIMEOUT_SECONDS)
+            if debug:
+                print(f"STATUS: {resp.status_code}", file=sys.stderr)
+                print(f"CONTENT-TYPE: {resp.headers.get('content-type')}", file=sys.stderr)
+                print(f"BODY (first 500): {resp.text[:500]}", file=sys.stderr)
             if resp.status_code == 429:
+                sleep_seconds = _BACKOFF_SECONDS[attempt]
                 retry_after = resp.headers.get("Retry-After")
                 if retry_after:
                     try:
                         sleep_seconds = float(retry_after)
                     except ValueError:
-                        sleep_seconds = 1.0 + (2 ** attempt)
-                else:
-                    sleep_seconds = 1.0 + (2 ** attempt)
+                        pass
                 time.sleep(sleep_seconds)
                 continue
             resp.raise_for_status()
-            parsed = resp.json()
+            parsed = orjson.loads(resp.content)
             content = parsed["choices"][0]["message"]["content"]
             try:
-                return json.loads(content)
-            except json.JSONDecodeError as exc:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError as exc:
                 cleaned = content.strip()
                 if cleaned.startswith("```"):
                     cleaned = cleaned.lstrip("`")
@@ -170,89 +209,130 @@ def call_openai(llm_input: dict) -> dict:
                     if cleaned.endswith("```"):
                         cleaned = cleaned[:-3].strip()
                 try:
-                    return json.loads(cleaned)
-                except json.JSONDecodeError:
+                    return orjson.loads(cleaned)
+                except orjson.JSONDecodeError:
                     raise RuntimeError(f"LLM returned non-JSON content: {content[:500]}") from exc
         except Exception as exc:
             last_error = exc
-            time.sleep(1.0 + attempt)
+            time.sleep(_BACKOFF_SECONDS[attempt])
 
     raise RuntimeError(f"LLM request failed: {str(last_error)}")
 
 
+_REQUIRED_KEYS = (
+    "title",
+    "high_level",
+    "key_findings",
+    "suspects",
+    "next_steps",
+    "limitations"
+)
+_LIST_KEYS = ("key_findings", "suspects", "next_steps", "limitations")
+
+
 def validate_llm_output(output: dict) -> list[str]:
     errors: list[str] = []
-    required_keys = [
-        "title",
-        "high_level",
-        "key_findings",
-        "suspects",
-        "next_steps",
-        "limitations"
-    ]
-    for key in required_keys:
+    for key in _REQUIRED_KEYS:
         if key not in output:
             errors.append(f"missing key: {key}")
 
-    def validate_list(name: str):
+    # Each list item reports only its first problem
+    for name in _LIST_KEYS:
         value = output.get(name)
         if not isinstance(value, list):
             errors.append(f"{name} is not a list")
-            return
+            continue
         for idx, item in enumerate(value):
             if not isinstance(item, dict):
                 errors.append(f"{name}[{idx}] is not an object")
                 continue
-            if not item.get("text"):
+            get = item.get
+            if not get("text"):
                 errors.append(f"{name}[{idx}].text missing")
-            evidence = item.get("evidence")
+                continue
+            evidence = get("evidence")
             if not isinstance(evidence, list) or not evidence:
                 errors.append(f"{name}[{idx}].evidence missing")
 
-    for list_key in ["key_findings", "suspects", "next_steps", "limitations"]:
-        validate_list(list_key)
-
     return errors
 
 
-def render_markdown(output: dict) -> str:
-    lines = []
-    lines.append(f"# {str(output.get('title', 'Performance Summary'))}")
-    lines.append("")
-    lines.append(str(output.get("high_level", "")))
-    lines.append("")
+_MARKDOWN_SECTIONS = (
+    ("Key Findings", "key_findings"),
+    ("Suspects", "suspects"),
+    ("Next Steps", "next_steps"),
+    ("Limitations", "limitations")
+)
 
-    def render_section(title: str, key: str):
-        lines.append(f"## {title}")
-        items = output.get(key, [])
-        for item in items:
-            lines.append(f"- {str(item.get('text', ''))}")
-        lines.append("")
 
-    render_section("Key Findings", "key_findings")
-    render_section("Suspects", "suspects")
-    render_section("Next Steps", "next_steps")
-    render_section("Limitations", "limitations")
+def render_markdown(output: dict) -> str:
+    lines = [
+        f"# {output.get('title', 'Performance Summary')}",
+        "",
+        str(output.get("high_level", "")),
+        ""
+    ]
 
-    lines.append("## Evidence Appendix")
-    for key in ["key_findings", "suspects", "next_steps", "limitations"]:
-        lines.append(f"### {key}")
+    # One pass per section fills both its bullets and its appendix entries
+    appendix = ["## Evidence Appendix"]
+    for title, key in _MARKDOWN_SECTIONS:
+        lines.append(f"## {title}")
+        appendix.append(f"### {key}")
         for item in output.get(key, []):
-            evidence = item.get("evidence", [])
+            get = item.get
+            text = get("text", "")
+            lines.append(f"- {text}")
+            evidence = get("evidence", [])
             if evidence:
-                lines.append(f"- {item.get('text', '')}")
-                for path in evidence:
-                    lines.append(f"  - {path}")
+                appendix.append(f"- {text}")
+                appendix.extend([f"  - {path}" for path in evidence])
         lines.append("")
+        appendix.append("")
+    lines.extend(appendix)
 
     return "\n".join(lines).strip() + "\n"
 
 
+def _explanation_cache_path(llm_input: dict) -> Path | None:
+    # Keyed on the model and the exact input it sees; PERFETTO_LLM_NOCACHE=1 opts out
+    if os.getenv("PERFETTO_LLM_NOCACHE"):
+        return None
+    model = os.getenv("OPENAI_MODEL", DEFAULT_MODEL)
+    digest = hashlib.sha256(
+        orjson.dumps({"model": model, "input": llm_input}, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    cache_dir = os.getenv("PERFETTO_AGENT_CACHE_DIR")
+    root = Path(cache_dir).expanduser() if cache_dir else Path.home() / ".cache" / "perfetto-agent"
+    return root / "explanations" / f"{digest}.json"
+
+
 def run_explain(analysis: dict, baseline: dict | None = None) -> tuple[dict, dict, str]:
     llm_input = build_llm_input(analysis, baseline)
-    llm_output = call_openai(llm_input)
-    errors = validate_llm_output(llm_output)
-    if errors:
-        raise RuntimeError(f"LLM output validation failed: {', '.join(errors)}")
+    cache_path = _explanation_cache_path(llm_input)
+    llm_output = None
+    if cache_path is not None:
+        try:
+            llm_output = orjson.loads(cache_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            llm_output = None
+        if not isinstance(llm_output, dict) or validate_llm_output(llm_output):
+            llm_output = None
+
+    if llm_output is None:
+        llm_output = call_openai(llm_input)
+        errors = validate_llm_output(llm_output)
+        if errors:
+            raise RuntimeError(f"LLM output validation failed: {', '.join(errors)}")
+        if cache_path is not None:
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path.write_bytes(orjson.dumps(llm_output))
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                try:
+                    tmp_path.unlink(missing_ok=True)
+                except OSError:
+                    pass
     markdown = render_markdown(llm_output)
     return llm_input, llm_output, markdown
@@ -0,0 +1,60 @@
+"""Output file helpers shared by the typer CLI and the argparse entry point."""
+
+import os
+from pathlib import Path
+
+import orjson
+
+
+def dump_json(data) -> bytes:
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
+def write_files(contents: dict[Path, bytes]) -> None:
+    """
+    Write each file next to its destination, then rename them all into place.
+
+    Each rename is atomic, so a reader never sees a partial file. The set as a
+    whole is not: if a later rename fails, earlier outputs are already new while
+    the rest stay old. Temp files never outlive the call.
+    """
+    staged = []
+    try:
+        for path, data in contents.items():
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            staged.append(tmp_path)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        for path in contents:
+            os.replace(staged[0], path)
+            staged.pop(0)
+    finally:
+        # Whatever is left was never renamed into place
+        for tmp_path in staged:
+            tmp_path.unlink(missing_ok=True)
+
+
+def write_json(path: Path, data) -> None:
+    write_files({path: dump_json(data)})
+
+
+def read_json(path: Path):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def write_explanation(out: Path, llm_input: dict, llm_output: dict, markdown: str) -> tuple[Path, Path]:
+    """
+    Write the explanation markdown, its JSON and the LLM input together.
+
+    Returns:
+        The (explanation JSON, LLM input JSON) paths written beside out
+    """
+    json_out = out.with_suffix(".json")
+    input_out = out.with_name("llm_input.json")
+    write_files({
+        json_out: dump_json(llm_output),
+        input_out: dump_json(llm_input),
+        out: markdown.encode("utf-8")
+    })
+    return json_out, input_out
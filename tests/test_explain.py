@@ -1,7 +1,16 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
+from perfetto_agent.explain import llm
 from perfetto_agent.explain.llm import build_llm_input, validate_llm_output
-from perfetto_agent.analyzer import _prefer_non_unknown_suspects
+from perfetto_agent.analyzer import (
+    _dominant_category,
+    _normalize_slice_name,
+    _prefer_non_unknown_suspects,
+    classify_slice_name
+)
 
 
 class TestExplain(unittest.TestCase):
@@ -24,6 +33,24 @@ class TestExplain(unittest.TestCase):
         self.assertEqual(len(current["features"]["long_slices_attributed"]["top"]), 10)
         self.assertEqual(len(current["features"]["app_sections"]["top_by_total_ms"]), 5)
 
+    def test_llm_input_self_baseline_matches_copy(self):
+        analysis = {
+            "summary": {"startup_dominant_category": "app", "top_suspect": "x"},
+            "features": {"window_breakdown": {"startup": {"by_category_ms": {"app": 12.5}}}}
+        }
+        copied = {
+            "summary": dict(analysis["summary"]),
+            "features": {"window_breakdown": {"startup": {"by_category_ms": {"app": 12.5}}}}
+        }
+        self.assertEqual(build_llm_input(analysis, analysis), build_llm_input(analysis, copied))
+
+    def test_window_deltas_are_floats(self):
+        current = {"features": {"window_breakdown": {"startup": {"by_category_ms": {"app": 5, "system": 2.5}}}}}
+        baseline = {"features": {"window_breakdown": {"startup": {"by_category_ms": {"app": 2}}}}}
+        startup = build_llm_input(current, baseline)["deltas"]["window_category_deltas_ms"]["startup"]
+        self.assertEqual(startup, {"app": 3.0, "framework": 0.0, "system": 2.5, "unknown": 0.0})
+        self.assertTrue(all(type(value) is float for value in startup.values()))
+
     def test_validate_llm_output(self):
         valid_output = {
             "title": "Performance Summary",
@@ -45,6 +72,25 @@ class TestExplain(unittest.TestCase):
         }
         self.assertTrue(validate_llm_output(invalid_output))
 
+    def test_run_explain_reuses_cached_output(self):
+        output = {
+            "title": "Performance Summary",
+            "high_level": "Summary text.",
+            "key_findings": [{"text": "Finding", "evidence": ["summary.startup_dominant_category"]}],
+            "suspects": [],
+            "next_steps": [],
+            "limitations": []
+        }
+        analysis = {"summary": {"startup_dominant_category": "app"}}
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {"PERFETTO_AGENT_CACHE_DIR": cache_dir, "PERFETTO_LLM_NOCACHE": ""}
+            with mock.patch.dict(os.environ, env), \
+                    mock.patch.object(llm, "call_openai", return_value=output) as call:
+                first = llm.run_explain(analysis)
+                second = llm.run_explain(analysis)
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(first, second)
+
     def test_prefer_non_unknown_suspects(self):
         suspects = [
             {"label": "a", "category": "unknown"},
@@ -60,6 +106,31 @@ class TestExplain(unittest.TestCase):
         self.assertFalse(used)
         self.assertEqual(filtered, suspects_unknown)
 
+    def test_normalize_slice_name(self):
+        self.assertEqual(_normalize_slice_name(None), "<internal slice>")
+        self.assertEqual(_normalize_slice_name("12345"), "<internal slice>")
+        self.assertEqual(_normalize_slice_name(" 42 "), "<internal slice>")
+        self.assertEqual(_normalize_slice_name("   "), "   ")
+        self.assertEqual(_normalize_slice_name("1a"), "1a")
+        self.assertEqual(_normalize_slice_name("Choreographer#doFrame"), "Choreographer#doFrame")
+
+    def test_dominant_category(self):
+        self.assertEqual(_dominant_category({}), (None, "No category totals available"))
+        self.assertEqual(_dominant_category({"app": 0.0, "system": 0.0}), (None, "Category totals are all zero"))
+        self.assertEqual(_dominant_category({"app": 2.0, "system": 2.0}), (None, "Category totals have a tie"))
+        self.assertEqual(_dominant_category({"app": 2.0, "system": 2.0, "unknown": 3.0}), ("unknown", None))
+        self.assertEqual(_dominant_category({"app": 5.0, "system": 1.0, "unknown": 1.0}), ("app", None))
+
+    def test_classify_slice_name(self):
+        self.assertEqual(classify_slice_name("UI#click", 10, 10), "app")
+        self.assertEqual(classify_slice_name("Choreographer#doFrame", 10, 10), "framework")
+        self.assertEqual(classify_slice_name("binder UI#click", 10, 10), "app")
+        self.assertEqual(classify_slice_name("Binder transaction", 10, 10), "system")
+        self.assertEqual(classify_slice_name("UI#click", 11, 10), "system")
+        self.assertEqual(classify_slice_name("UI#click", 10, None), "unknown")
+        self.assertEqual(classify_slice_name("futex_wait", None, None), "system")
+        self.assertEqual(classify_slice_name(None, 10, 10), "unknown")
+
 
 if __name__ == "__main__":
     unittest.main()